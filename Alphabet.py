@@ -0,0 +1,124 @@
+import numpy as np
+import itertools
+
+#How the words of a Trie are turned into the letters its nodes hold
+# and back, for words that aren't strings.
+#"bytes" keeps the byte values of `bytes`-like words, uint8 arrays
+# and strings (as UTF-8),
+# "tokens" keeps the integers of sequences or integer arrays like
+# tokenizer ids, and any other iterable is a fixed set of symbols
+# each interned as its position in it.
+#Words come back as `bytes`, tuples of ints, and strings (if every
+# symbol is one) or tuples of symbols respectively
+class Alphabet:
+    KINDS = ("bytes", "tokens")
+
+    def __init__(self, symbols):
+        if isinstance(symbols, str) and symbols in self.KINDS:
+            self.kind = symbols
+            return
+        self.kind = "symbols"
+        if isinstance(symbols, np.ndarray):
+            symbols = symbols.tolist()
+        self.symbols = list(symbols)
+        self.codes = {symbol: code for code, symbol in enumerate(self.symbols)}
+        if len(self.codes) < len(self.symbols):
+            raise ValueError("The symbols of an alphabet must be distinct")
+        self.text = all(isinstance(symbol, str) for symbol in self.symbols)
+        #Integer symbols are also looked up by value in an array
+        # so whole arrays of them are interned at once
+        self.table = None
+        if self.symbols and all(
+            isinstance(symbol, int) and 0 <= symbol < 1 << 24
+            for symbol in self.symbols
+        ):
+            self.table = np.full(max(self.symbols) + 1, -1, dtype=np.int64)
+            self.table[self.symbols] = np.arange(len(self.symbols))
+
+    #Value to save in place of the alphabet
+    def spec(self):
+        return self.kind if self.kind in self.KINDS else self.symbols
+
+    #Get the letters stored for `word`, which can be hashed, sliced and
+    # compared as a whole.
+    #Symbols outside the alphabet raise a ValueError when `strict`
+    # and otherwise become -1, which matches no letter
+    def encode(self, word, strict: bool = False):
+        if self.kind == "bytes":
+            if isinstance(word, bytes):
+                return word
+            if isinstance(word, np.ndarray):
+                return word.astype(np.uint8, copy=False).tobytes()
+            if isinstance(word, str):
+                return word.encode()
+            return bytes(word)
+        if self.kind == "tokens":
+            if isinstance(word, tuple):
+                return word
+            if isinstance(word, np.ndarray):
+                return tuple(word.tolist())
+            return tuple(word)
+        if isinstance(word, np.ndarray):
+            if (self.table is not None and word.dtype.kind in "iu"
+                and (not len(word) or
+                     (word.min() >= 0 and word.max() < len(self.table)))):
+                codes = self.table[word]
+                if not strict or (codes >= 0).all():
+                    return tuple(codes.tolist())
+            word = word.tolist()
+        codes = self.codes
+        if strict:
+            try:
+                return tuple([codes[symbol] for symbol in word])
+            except KeyError as error:
+                raise ValueError(
+                    f"{error.args[0]!r} isn't in the alphabet"
+                ) from None
+        return tuple([codes.get(symbol, -1) for symbol in word])
+
+    #Get the letters of many words as one int64 array of codes,
+    # one word after the other, and an array of the number of letters
+    # of each, like `encode` without `strict`.
+    #Bytes and integer arrays are converted whole instead of
+    # one letter at a time
+    def encode_many(self, words: list)->tuple:
+        if self.kind == "bytes":
+            parts = [self.encode(word) for word in words]
+            codes = np.frombuffer(b"".join(parts), dtype=np.uint8)
+        elif self.kind == "tokens":
+            parts = [np.asarray(word, dtype=np.int64) for word in words]
+            codes = np.concatenate(parts) if parts else ()
+        elif self.table is not None and all(
+            isinstance(word, np.ndarray) and word.dtype.kind in "iu"
+            for word in words
+        ):
+            parts = words
+            values = np.concatenate(parts) if parts else np.zeros(0)
+            values = values.astype(np.int64)
+            inside = (values >= 0) & (values < len(self.table))
+            codes = np.where(
+                inside, self.table[np.where(inside, values, 0)], -1
+            )
+        else:
+            parts = [self.encode(word) for word in words]
+            codes = np.fromiter(
+                itertools.chain.from_iterable(parts), dtype=np.int64
+            )
+        lengths = np.fromiter(
+            map(len, parts), dtype=np.int64, count=len(parts)
+        )
+        return np.asarray(codes, dtype=np.int64), lengths
+
+    #Rebuild a word from the letters of the nodes down to its end,
+    # which are whole labels in radix mode
+    def join(self, parts: list, radix: bool = False):
+        if self.kind == "bytes":
+            return b"".join(parts) if radix else bytes(parts)
+        if radix:
+            letters = tuple(itertools.chain.from_iterable(parts))
+        else:
+            letters = tuple(parts)
+        if self.kind == "tokens":
+            return letters
+        symbols = [self.symbols[code] for code in letters]
+        return "".join(symbols) if self.text else tuple(symbols)
@@ -1,530 +1,2154 @@
-from LinkedList import LinkedList
+from FrozenTrie import FrozenTrie
+from Alphabet import Alphabet
+from array import array
 import numpy as np
+import itertools
+import heapq
+import contextlib
+import gc
+import mmap
+import os
+import sys
+import time
+import functools
+import collections
+import threading
+import multiprocessing
+import bisect
 
 class Trie:
-    class Reference:
-        def __init__(self, data):
-            self.data = data
+    #Fenwick tree over insertion slots.
+    #Every word instance keeps the slot it was given when appended
+    # and its position is the number of live slots before it,
+    # so removing an instance doesn't touch any other slot
+    class OrderIndex:
+        #`owners` holds the word end node of each starting slot
+        def __init__(self, owners: list = ()):
+            size = len(owners)
+            self.live = bytearray(b"\1"*size)
+            #Word end node of each slot so a position can be
+            # turned into a word without searching the Trie
+            self.owners = list(owners)
+            self.count = size
+            #1-based tree of live slot counts
+            self.tree = array("q", [0]*(size + 1))
+            for i in range(1, size + 1):
+                self.tree[i] += 1
+                parent = i + (i & -i)
+                if parent <= size:
+                    self.tree[parent] += self.tree[i]
+
+        def __len__(self)->int:
+            return self.count
+
+        #Add a live slot owned by `owner` after all the others 
+        # and return it
+        def add(self, owner)->int:
+            slot = len(self.live)
+            self.live.append(1)
+            self.owners.append(owner)
+            self.count += 1
+            #The new tree cell covers the slots in 
+            # (i - lowbit(i), i] which are all live 
+            # if none were ever removed
+            i = slot + 1
+            if self.count == len(self.live):
+                self.tree.append(i & -i)
+                return slot
+            #Otherwise sum the cells below it in that range
+            total = 1
+            j = i - 1
+            stop = i - (i & -i)
+            while j > stop:
+                total += self.tree[j]
+                j -= j & -j
+            self.tree.append(total)
+            return slot
+
+        #Mark a slot as no longer live
+        def remove(self, slot: int):
+            if not self.live[slot]:
+                return
+            self.live[slot] = 0
+            self.owners[slot] = None
+            self.count -= 1
+            i = slot + 1
+            while i < len(self.tree):
+                self.tree[i] -= 1
+                i += i & -i
+
+        #Get the position of a slot among the live slots
+        def rank(self, slot: int)->int:
+            #Slots are positions until one is removed
+            if self.count == len(self.live):
+                return slot
+            position = 0
+            i = slot
+            while i > 0:
+                position += self.tree[i]
+                i -= i & -i
+            return position
+
+        #Get the slot at a position among the live slots
+        def select(self, position: int)->int:
+            if self.count == len(self.live):
+                return position
+            slot = 0
+            step = 1 << (len(self.tree) - 1).bit_length()
+            while step:
+                i = slot + step
+                if i < len(self.tree) and self.tree[i] <= position:
+                    slot = i
+                    position -= self.tree[i]
+                step >>= 1
+            return slot
 
     class Node:
-        def __init__(self, letter="", children=LinkedList(), is_end=False):
+        #Source of `rank`s. Siblings are ranked in the order they were added
+        ranks = itertools.count()
+
+        def __init__(self, letter="", is_end=False, index=None, parent=None):
             self.letter = letter
-            self.children = children
+            self.parent = parent
+            self.rank = 0
+            #Number of instances ending at or below this node
+            # and the most popular word end among them (None if there are none)
+            self.size = 0
+            self.best = None
+            #Letter to child dict so a child can be found, added, 
+            # removed or replaced in constant time.
+            #Dicts keep insertion order so the children are 
+            # walked in the order they were added
+            self.index = dict() if index is None else index
             self.is_end = is_end
+
+        #Get the child holding `letter` or None if there is none
+        def find(self, letter):
+            return self.index.get(letter)
+
+        #Letter the parent indexes the node by
+        def key(self):
+            return self.letter
+
+        #Add a child after the others
+        def add(self, child):
+            child.parent = self
+            child.rank = next(self.ranks)
+            self.index[child.key()] = child
+            return child
+
+        #Put `new` in the place of the child `old`.
+        #It takes over the rank of `old` and must have the same key,
+        # so assigning it keeps its place in the dict
+        def replace(self, old, new):
+            new.parent = self
+            new.rank = old.rank
+            self.index[new.key()] = new
+
+        #Remove a child
+        def remove(self, child):
+            del self.index[child.key()]
+
+    #Node of a radix mode Trie. Its letter is the label of a whole edge,
+    # one or more letters long, and its parent indexes it
+    # by the first of them
+    class RadixNode(Node):
+        def key(self):
+            return self.letter[0]
+
+    #Bounded cache of query results, least recently used out first.
+    #Results are only valid for the `version` of the Trie they were
+    # computed at, so the cache empties itself when that changes
+    class ResultCache:
+        def __init__(self, size: int):
+            self.size = size
+            self.results = collections.OrderedDict()
+            self.version = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+            self.invalidations = 0
+
+        #Returned by `lookup` for results that aren't cached
+        MISSING = object()
+
+        #Get the result for `key` at `version`, 
+        # or compute it with `function(*args)` and keep it
+        def get(self, key, version: int, function, *args):
+            try:
+                result = self.lookup(key, version)
+            except TypeError:
+                #Words that can't be hashed aren't cached
+                return function(*args)
+            if result is self.MISSING:
+                result = function(*args)
+                self.store(key, result)
+            return result
+
+        def lookup(self, key, version: int):
+            if version != self.version:
+                if self.results:
+                    self.invalidations += 1
+                    self.results.clear()
+                self.version = version
+            result = self.results.get(key, self.MISSING)
+            if result is self.MISSING:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.results.move_to_end(key)
+            return result
+
+        def store(self, key, result):
+            self.results[key] = result
+            if len(self.results) > self.size:
+                self.results.popitem(last=False)
+                self.evictions += 1
+
+        def stats(self)->dict:
+            return {
+                "size": len(self.results), "max_size": self.size,
+                "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, 
+                "invalidations": self.invalidations
+            }
+
+    #`ResultCache` for a concurrent Trie, where several readers 
+    # can use it at once.
+    #Results are computed outside of the lock
+    class LockedResultCache(ResultCache):
+        def __init__(self, size: int):
+            super().__init__(size)
+            self.lock = threading.Lock()
+
+        def lookup(self, key, version: int):
+            with self.lock:
+                return super().lookup(key, version)
+
+        def store(self, key, result):
+            with self.lock:
+                super().store(key, result)
+
+    #Lock letting any number of readers or one writer in at a time.
+    #Waiting writers go before new readers so a steady stream of
+    # readers can't hold them off.
+    #A thread holding the lock can take it again to read or, if it is
+    # the writer, to write, as operations call each other
+    class ReadWriteLock:
+        def __init__(self):
+            self.condition = threading.Condition(threading.Lock())
+            self.readers = 0
+            self.waiting_writers = 0
+            #Thread holding the lock to write and how many times it has
+            self.writer = None
+            self.writes = 0
+            #Number of times each thread holds the lock to read
+            self.local = threading.local()
+
+        @contextlib.contextmanager
+        def reading(self):
+            reads = getattr(self.local, "reads", 0)
+            if reads or self.writer == threading.get_ident():
+                self.local.reads = reads + 1
+                try:
+                    yield
+                finally:
+                    self.local.reads = reads
+                return
+            with self.condition:
+                while self.writer is not None or self.waiting_writers:
+                    self.condition.wait()
+                self.readers += 1
+            self.local.reads = 1
+            try:
+                yield
+            finally:
+                self.local.reads = 0
+                with self.condition:
+                    self.readers -= 1
+                    if not self.readers:
+                        self.condition.notify_all()
+
+        @contextlib.contextmanager
+        def writing(self):
+            thread = threading.get_ident()
+            if self.writer == thread:
+                self.writes += 1
+                try:
+                    yield
+                finally:
+                    self.writes -= 1
+                return
+            if getattr(self.local, "reads", 0):
+                raise RuntimeError(
+                    "A thread reading the Trie can't write to it"
+                )
+            with self.condition:
+                self.waiting_writers += 1
+                try:
+                    while self.writer is not None or self.readers:
+                        self.condition.wait()
+                finally:
+                    self.waiting_writers -= 1
+                self.writer = thread
+                self.writes = 1
+            try:
+                yield
+            finally:
+                with self.condition:
+                    self.writer = None
+                    self.writes = 0
+                    self.condition.notify_all()
+
+    #Counts and times of the operations run under `Trie.profile`.
+    #Each operation records the nodes it visited, the children it 
+    # looked up and the deepest node it reached, and the ones it
+    # calls are counted as part of it
+    class Stats:
+        def __init__(self):
+            #Operation name to totals over all its calls
+            self.operations = dict()
+            #Functions given the record of every call as it finishes
+            self.callbacks = []
+            #Record of the running outermost call
+            self.call = None
+            self.nesting = 0
+            self.started = 0.0
+
+        def start(self, operation: str):
+            self.nesting += 1
+            if self.nesting == 1:
+                self.call = {
+                    "operation": operation, "seconds": 0.0,
+                    "nodes": 0, "comparisons": 0, "depth": 0
+                }
+                self.started = time.perf_counter()
+
+        def finish(self):
+            self.nesting -= 1
+            if self.nesting:
+                return
+            call, self.call = self.call, None
+            call["seconds"] = time.perf_counter() - self.started
+            totals = self.operations.setdefault(call["operation"], {
+                "calls": 0, "seconds": 0.0, 
+                "nodes": 0, "comparisons": 0, "depth": 0
+            })
+            totals["calls"] += 1
+            for name in ("seconds", "nodes", "comparisons"):
+                totals[name] += call[name]
+            totals["depth"] = max(totals["depth"], call["depth"])
+            for callback in self.callbacks:
+                callback(call)
+
+        #Count nodes visited by the running call
+        def visit(self, nodes: int, comparisons: int, depth: int):
+            call = self.call
+            if call is None:
+                return
+            call["nodes"] += nodes
+            call["comparisons"] += comparisons
+            if depth > call["depth"]:
+                call["depth"] = depth
+
+    #`Stats` for a concurrent Trie, where several threads run 
+    # operations at once.
+    #Each thread has its own running call, and finished calls are 
+    # added to the totals and given to the callbacks one at a time
+    class LockedStats(Stats):
+        def __init__(self):
+            self.local = threading.local()
+            self.lock = threading.Lock()
+            super().__init__()
+
+        @property
+        def call(self):
+            return getattr(self.local, "call", None)
+
+        @call.setter
+        def call(self, call):
+            self.local.call = call
+
+        @property
+        def nesting(self):
+            return getattr(self.local, "nesting", 0)
+
+        @nesting.setter
+        def nesting(self, nesting):
+            self.local.nesting = nesting
+
+        @property
+        def started(self):
+            return getattr(self.local, "started", 0.0)
+
+        @started.setter
+        def started(self, started):
+            self.local.started = started
+
+        def finish(self):
+            with self.lock:
+                super().finish()
     
-    def __init__(self, sequences=set()):
-        self.root = self.Node("", LinkedList())
+    #In `radix` mode chains of nodes with one child that don't end
+    # a word are kept as one node, split when a word branches off 
+    # inside it and merged back when the branch is removed.
+    #Without `track_order` only the number of instances of each word
+    # is kept, and what needs their order raises a ValueError.
+    #With a `cache_size` the results of up to that many `nearest`,
+    # `popular` and `in` queries are cached until the Trie changes.
+    #A `concurrent` Trie can be used from many threads. Queries run
+    # alongside each other, and changes wait for them and hold them off.
+    #`snapshot` gives readers a FrozenTrie to query without the lock,
+    # but it isn't copy-on-write: the first one after a change
+    # freezes the whole Trie while holding off changes
+    #Words other than strings take an `alphabet` ("bytes", "tokens" or
+    # the symbols to intern, see `Alphabet`)
+    def __init__(self, sequences=set(), radix: bool = False, 
+                 track_order: bool = True, cache_size: int = 0,
+                 concurrent: bool = False, alphabet=None):
+        self.radix = radix
+        if alphabet is not None and not isinstance(alphabet, Alphabet):
+            alphabet = Alphabet(alphabet)
+        self.alphabet = alphabet
+        self.node_type = self.RadixNode if radix else self.Node
+        self.root = self.node_type("")
         self.word_count = 0
+        #Word end to the insertion slots of its instances,
+        # or to their number without `track_order`.
+        #`order` turns slots into positions
+        self.track_order = track_order
         self.end_to_index = dict() 
-        for sequence in sequences:
-            self.append(sequence)
+        self.order = self.OrderIndex() if track_order else None
+        #`Stats` while profiling
+        self.stats = None
+        #Number of changes made to the Trie so far
+        self.version = 0
+        cache_type = (
+            self.LockedResultCache if concurrent else self.ResultCache
+        )
+        self.cache = cache_type(cache_size) if cache_size else None
+        #(version, FrozenTrie) of the last `snapshot`
+        self.__snapshot = None
+        self.lock = None
+        if concurrent:
+            self.lock = self.ReadWriteLock()
+            self.__class__ = self.__locked(type(self))
+        self.extend(sequences)
+
+    #Build a Trie from many words at once
+    #Other keyword arguments go to the constructor
+    @classmethod
+    def from_iterable(cls, sequences, presorted: bool = False, **options):
+        trie = cls(**options)
+        trie.extend(sequences, presorted)
+        return trie
+
+    #Build a Trie from the records of a file, see `ingest`
+    #Other keyword arguments go to the constructor
+    @classmethod
+    def from_file(cls, path: str, delimiter: bytes = b"\n", 
+                  encoding: str = "utf-8", presorted: bool = False, 
+                  progress=None, chunksize: int = 1 << 24, **options):
+        trie = cls(**options)
+        trie.ingest(
+            path, delimiter, encoding, presorted, progress, chunksize
+        )
+        return trie
 
     #Query
 
     def __len__(self)->int:
         return self.word_count
     
-    #Recursive helper of `depth_counts`
-    def __depth_counts(self, root: Node, 
-                       curr_freq: Reference = Reference(0),
-                       depth: int = 0, depth_to_count: list = [])->list:
-        #Add to the root frequency with the frequencies of its children
-        root_frequency = 0
-        #Recurse on each of `root`'s children down to the last node
-        # while updating the depth count list
-        for node in root.children:
-            child = node.get()
+    #Visit every node below `root` in preorder without recursion.
+    #Yields (node, depth below `root`, path) where `path` is a buffer
+    # of the letters from below `root` down to the node.
+    #The buffer is reused between steps so it has to be 
+    # joined or copied before the next one.
+    #Children are read once the walk moves past a node so 
+    # children removed from the node just yielded aren't visited
+    def __traverse(self, root: Node):
+        path = []
+        stack = [(root, 0)]
+        while stack:
+            node, depth = stack.pop()
+            #Replace the letters below the parent with the node's letter
+            if depth:
+                del path[depth - 1:]
+                path.append(node.letter)
+            yield node, depth, path
+            #Push in reverse so the first child is visited first
+            children = list(node.index.values())
+            children.reverse()
+            for child in children:
+                stack.append((child, depth + 1))
+
+    #Generate a list maping depth to the numnber of letters there
+    def depth_counts(self)->list: 
+        depth_to_count = []
+        #Number of letters down to the end of each node on the path.
+        #A radix node covers one depth per letter of its label
+        reach = [0]
+        for node, depth, _ in self.__traverse(self.root):
+            if not depth:
+                continue
+            del reach[depth:]
+            reach.append(reach[-1] + (len(node.letter) if self.radix else 1))
             #Add to the size of the depth count list when necessary
-            if depth == len(depth_to_count):
+            while reach[-1] > len(depth_to_count):
                 depth_to_count.append(0)
-            #Recurse on the child with an incremented depth
-            self.__depth_counts(child, curr_freq, 
-                                depth+1, depth_to_count)
-            #Add to the frequency with the current child's frequency
-            # if it is a word end
-            if child.is_end:
-                curr_freq.data += len(self.end_to_index[child])
-            #Add to the count for this depth
-            depth_to_count[depth] += curr_freq.data
-            #Append the current frequency to `frequencies`
-            root_frequency += curr_freq.data
-        #Set the current frequency to the root frequency
-        # so that the previous call and gets the right frequency
-        curr_freq.data = root_frequency
+            #Every instance at or below the node has a letter 
+            # at each of its depths
+            for i in range(reach[-2], reach[-1]):
+                depth_to_count[i] += node.size
         return depth_to_count
-    
-    #Generate a list maping depth to the numnber of letters there
-    def depth_counts(self)->list: 
-        return self.__depth_counts(
-            self.root, self.Reference(0), 0, []
+
+    #Convert to a read-only `FrozenTrie` backed by flat arrays
+    def freeze(self)->FrozenTrie:
+        return FrozenTrie.from_trie(self)
+
+    #Write the Trie to `path` in the `FrozenTrie` binary format
+    def save(self, path: str):
+        self.freeze().save(path)
+
+    #Open a Trie written by `save` as a read-only `FrozenTrie`
+    @staticmethod
+    def load(path: str, mmap: bool = True)->FrozenTrie:
+        return FrozenTrie.load(path, mmap)
+
+    #Introspection
+
+    #Operations `profile` counts and times.
+    #Generators (`items`, `frequencies`, `iter_decompress`) aren't
+    # since their time depends on how they are consumed
+    OPERATIONS = (
+        "append", "extend", "merge", "delete", "prune", "rebuild_index",
+        "__contains__", "nearest", "popular", "top_k", "fuzzy", "unique",
+        "decompress", "depth_counts", "contains_many", "count_many",
+        "nearest_many", "freeze", "save", "memory_report", "ingest"
+    )
+
+    #Count and time the operations run in the block.
+    #Yields the `Stats` they are recorded in. `callback` is given
+    # the record of each call, a dict of its operation, seconds, 
+    # nodes, comparisons and depth, as it finishes.
+    #The Trie is switched to a subclass that does the recording for 
+    # the duration of the block, so it costs nothing the rest of the time
+    @contextlib.contextmanager
+    def profile(self, callback=None):
+        if self.stats is not None:
+            raise ValueError("The Trie is already being profiled")
+        cls = type(self)
+        self.stats = (
+            self.Stats if self.lock is None else self.LockedStats
+        )()
+        if callback is not None:
+            self.stats.callbacks.append(callback)
+        self.__class__ = self.__profiled(cls)
+        try:
+            yield self.stats
+        finally:
+            self.__class__ = cls
+            self.stats = None
+
+    #Subclasses made by `__profiled`, by the class they profile
+    __profiled_classes = dict()
+
+    #Get the subclass of `cls` that records to `stats`.
+    #Public operations are timed, and the helpers every walk goes
+    # through count the nodes from their arguments and results
+    @staticmethod
+    def __profiled(cls):
+        profiled = Trie.__profiled_classes.get(cls)
+        if profiled is not None:
+            return profiled
+        depth = Trie.__depth
+        namespace = {
+            name: Trie.__timed(getattr(cls, name), name)
+            for name in Trie.OPERATIONS
+        }
+        #Each counter turns (result, arguments) into 
+        # (nodes, comparisons, depth)
+        counters = {
+            "_Trie__walk": lambda result, word: Trie.__walked(result, word),
+            "_Trie__walk_many": lambda results, words: (
+                Trie.__walked_many(results, words)
+            ),
+            "_Trie__insert": lambda end, word: (
+                depth(end), depth(end), depth(end)
+            ),
+            "_Trie__word": lambda word, node: (depth(node), 0, depth(node)),
+            "_Trie__count_added": lambda _, end: (
+                depth(end) + 1, 0, depth(end)
+            ),
+            "_Trie__count_removed": lambda _, node, end: (
+                depth(node) + 1, 0, depth(node)
+            ),
+        }
+        for name, counter in counters.items():
+            namespace[name] = Trie.__counted(getattr(cls, name), counter)
+        traverse = getattr(cls, "_Trie__traverse")
+        def counted_traverse(self, root):
+            stats = self.stats
+            for step in traverse(self, root):
+                if stats is not None:
+                    stats.visit(1, 0, step[1])
+                yield step
+        namespace["_Trie__traverse"] = counted_traverse
+        def visit(self, nodes, comparisons, depth):
+            stats = self.stats
+            if stats is not None:
+                stats.visit(nodes, comparisons, depth)
+        namespace["_Trie__visit"] = visit
+        profiled = type(cls.__name__, (cls,), namespace)
+        Trie.__profiled_classes[cls] = profiled
+        return profiled
+
+    #Wrap a method so its calls are recorded as `operation`
+    @staticmethod
+    def __timed(method, operation: str):
+        @functools.wraps(method)
+        def timed(self, *args, **kwargs):
+            #Threads of a concurrent Trie can still be in the subclass
+            # after the block ends
+            stats = self.stats
+            if stats is None:
+                return method(self, *args, **kwargs)
+            stats.start(operation)
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                stats.finish()
+        return timed
+
+    #Wrap a helper so the nodes it went through are counted
+    @staticmethod
+    def __counted(method, counter):
+        @functools.wraps(method)
+        def counted(self, *args):
+            result = method(self, *args)
+            stats = self.stats
+            if stats is not None:
+                stats.visit(*counter(result, *args))
+            return result
+        return counted
+
+    #Nodes, comparisons and depth of a `__walk`. Each node below the
+    # root was looked up, and so was the child a mismatch stopped at
+    @staticmethod
+    def __walked(result: tuple, word: str)->tuple:
+        node, matches, rest = result
+        depth = Trie.__depth(node)
+        return depth, depth + (matches < len(word) and not rest), depth
+
+    #`__walked` summed over a `__walk_many`
+    @staticmethod
+    def __walked_many(results: list, words: list)->tuple:
+        nodes = comparisons = deepest = 0
+        for result, word in zip(results, words):
+            walked = Trie.__walked(result, word)
+            nodes += walked[0]
+            comparisons += walked[1]
+            deepest = max(deepest, walked[2])
+        return nodes, comparisons, deepest
+
+    #Number of nodes above a node
+    @staticmethod
+    def __depth(node: Node)->int:
+        depth = 0
+        while node.parent is not None:
+            node = node.parent
+            depth += 1
+        return depth
+
+    #Report the visits of loops that aren't made of the helpers
+    # `profile` counts. Does nothing unless profiling
+    def __visit(self, nodes: int, comparisons: int, depth: int):
+        pass
+
+    #Break the memory held by the Trie down in bytes, 
+    # as measured by `sys.getsizeof`
+    def memory_report(self)->dict:
+        size = sys.getsizeof
+        report = {
+            "nodes": 0, "node_bytes": 0, "child_index_bytes": 0,
+            "label_bytes": 0,
+            "word_ends": len(self.end_to_index), "end_to_index_bytes": 0,
+            "order_bytes": 0,
+        }
+        for node, _, _ in self.__traverse(self.root):
+            report["nodes"] += 1
+            report["node_bytes"] += size(node) + size(node.__dict__)
+            report["child_index_bytes"] += size(node.index)
+            #Single letters are shared by all the nodes holding them
+            if self.radix:
+                report["label_bytes"] += size(node.letter)
+        report["end_to_index_bytes"] = size(self.end_to_index) + sum(
+            size(indicies) + sum(map(size, indicies)) if self.track_order
+            else size(indicies)
+            for indicies in self.end_to_index.values()
         )
+        if self.order is not None:
+            report["order_bytes"] = (
+                size(self.order.live) + size(self.order.owners) 
+                + size(self.order.tree)
+            )
+        report["total_bytes"] = sum(
+            value for name, value in report.items() 
+            if name.endswith("_bytes")
+        )
+        return report
+
+    #Concurrency
+
+    #Get a read-only copy of the Trie as it is now.
+    #The copy is shared until the Trie changes, so readers can keep
+    # querying it without locks while a writer changes the Trie.
+    #It isn't copy-on-write. The first call after any change freezes 
+    # the whole Trie again, which is O(number of nodes) (1 to 2 s for
+    # 100k words) and holds the lock to read all along, so writers 
+    # wait for it. Take snapshots after batches of changes rather
+    # than after each one
+    def snapshot(self)->FrozenTrie:
+        snapshot = self.__snapshot
+        if snapshot is None or snapshot[0] != self.version:
+            snapshot = self.__snapshot = (self.version, self.freeze())
+        return snapshot[1]
+
+    #Operations a concurrent Trie runs holding its lock to read or write
+    READS = (
+        "__contains__", "nearest", "popular", "top_k", "fuzzy", "unique",
+        "decompress", "depth_counts", "contains_many", "count_many",
+        "nearest_many", "freeze", "save", "memory_report", "snapshot"
+    )
+    WRITES = (
+        "append", "extend", "merge", "delete", "prune", "rebuild_index",
+        "ingest"
+    )
+    #Generators, which a concurrent Trie runs in batches of up to
+    # `BATCH` steps holding its lock to read, so it isn't held 
+    # while their results are used
+    ITERATORS = ("items", "frequencies", "iter_decompress")
+    BATCH = 1024
+
+    #Subclasses made by `__locked`, by the class they lock
+    __locked_classes = dict()
+
+    #Get the subclass of `cls` whose operations hold `lock`
+    @staticmethod
+    def __locked(cls):
+        locked = Trie.__locked_classes.get(cls)
+        if locked is not None:
+            return locked
+        namespace = dict()
+        for names, mode in ((Trie.READS, "reading"), 
+                            (Trie.WRITES, "writing")):
+            for name in names:
+                namespace[name] = Trie.__guarded(getattr(cls, name), mode)
+        for name in Trie.ITERATORS:
+            namespace[name] = Trie.__batched(getattr(cls, name))
+        locked = type(cls.__name__, (cls,), namespace)
+        Trie.__locked_classes[cls] = locked
+        return locked
+
+    #Wrap a method so it holds the lock in `mode` ("reading" or "writing")
+    @staticmethod
+    def __guarded(method, mode: str):
+        @functools.wraps(method)
+        def guarded(self, *args, **kwargs):
+            with getattr(self.lock, mode)():
+                return method(self, *args, **kwargs)
+        return guarded
+
+    #Wrap a generator so it runs in batches holding the lock to read.
+    #Like iterating over a dict, changing the Trie between batches
+    # raises a RuntimeError in the next one. Iterate over a `snapshot`
+    # to be able to change the Trie at the same time
+    @staticmethod
+    def __batched(method):
+        @functools.wraps(method)
+        def batched(self, *args, **kwargs):
+            steps = method(self, *args, **kwargs)
+            version = None
+            while True:
+                with self.lock.reading():
+                    if version is not None and version != self.version:
+                        raise RuntimeError(
+                            "The Trie changed during iteration"
+                        )
+                    version = self.version
+                    batch = list(itertools.islice(steps, Trie.BATCH))
+                yield from batch
+                if len(batch) < Trie.BATCH:
+                    return
+        return batched
 
     #Search/Traversal
 
-    def __contains__(self, word: str, instance: int = 0)->bool:
-        #Going down the Trie and checking for matches
-        # until the full word is found using a 
-        # child-node-searching algorithm
+    #Go down the Trie for as long as the letters of `word` match.
+    #Returns the last matched node, the number of matches and the
+    # number of letters of the node's label left unmatched, which is
+    # only ever more than 0 in radix mode
+    def __walk(self, word: str)->tuple:
         parent = self.root
-        children = parent.children
+        matches = 0
+        if self.radix:
+            while matches < len(word):
+                child = parent.index.get(word[matches])
+                if child is None:
+                    break
+                common = self.__label_match(word, matches, child.letter)
+                #The match stops inside the child's label
+                if common < len(child.letter):
+                    return child, matches + common, len(child.letter) - common
+                parent = child
+                matches += common
+            return parent, matches, 0
         for letter in word:
-            #Iterating through the children 
-            #and checking for a match
-            found = False
-            child = None
-            for node in children:
-                child = node.get()
-                if child.letter != letter:
-                    continue
-                found = True
-                break
+            child = parent.find(letter)
             #If no matching child was found, stop
-            if not found:
+            if child is None:
                 break
-            #Advance the parent and children
+            #Advance the parent and match count
             parent = child
-            children = parent.children
-        #Check that it has as many instances as required
-        return (len(self.end_to_index[parent]) >= instance)
-    
-    #Get a node at the end of a certain word
-    def __get_word_end_node(self, word: str)->Node:
-        #Going down the Trie and checking letters 
-        # until the full word is found using a 
-        # child-node-searching algorithm
-        parent = self.root
-        children = parent.children
-        for letter in word:
-            #Iterating through the children 
-            #and checking for a match
-            found = False
-            child = None
-            for node in children:
-                child = node.get()
-                if child.letter != letter:
+            matches += 1
+        return parent, matches, 0
+
+    #Number of letters of a radix node's `label` matching `word` 
+    # from `start`, given that the first one does
+    @staticmethod
+    def __label_match(word: str, start: int, label: str)->int:
+        if word[start:start + len(label)] == label:
+            return len(label)
+        common = 1
+        while (start + common < len(word) 
+               and word[start + common] == label[common]):
+            common += 1
+        return common
+
+    #Length of the common prefix of two words, up to `limit`
+    @staticmethod
+    def __common_prefix(word: str, other: str, limit: int)->int:
+        high = min(len(word), len(other), limit)
+        #Neighbouring sorted words often share the whole prefix
+        # which one slice comparison can confirm
+        if word[:high] == other[:high]:
+            return high
+        common = 0
+        while word[common] == other[common]:
+            common += 1
+        return common
+
+    #`__walk` for many words at once.
+    #The words are walked in sorted order so each one starts from 
+    # the end of its common prefix with the previous one.
+    #Returns the results of `__walk` in input order
+    def __walk_many(self, words: list)->list:
+        #Radix nodes don't line up with prefix lengths
+        if self.radix:
+            return [self.__walk(word) for word in words]
+        results = [None]*len(words)
+        #Nodes matched by the previous word. path[i] is the node after i letters
+        path = [self.root]
+        previous = None
+        result = None
+        with self.__paused_gc():
+            for i in sorted(range(len(words)), key=words.__getitem__):
+                word = words[i]
+                #Repeats share the previous result
+                if word == previous:
+                    results[i] = result
                     continue
-                found = True
-                break
-            #Break if no match is found
-            if not found:
-                break
-            #Advance the parent and children
-            parent = child
-            children = parent.children
-        return parent
+                if previous is not None:
+                    common = self.__common_prefix(
+                        word, previous, len(path) - 1
+                    )
+                    del path[common + 1:]
+                parent = path[-1]
+                for letter in word[len(path) - 1:]:
+                    child = parent.index.get(letter)
+                    if child is None:
+                        break
+                    path.append(child)
+                    parent = child
+                result = results[i] = (parent, len(path) - 1, 0)
+                previous = word
+        return results
 
-    #Build strings by visiting every node beyond a certain node
-    def __subtree(self, root: Node, word: str = "", result_list: list = [])->list:
-        #Append the result and return if it is a leaf node
-        if not len(root.children):
-            result_list.append(word)
-            return result_list
-        #Otherwise recurse on each of its children down to the last node
-        for node in root.children:
-            child = node.get()
-            #Recurse on the child with the word
-            # extended by the child's letter
-            self.__subtree(child, word+child.letter, result_list)
-        return result_list
+    #`in` for many words. Returns a bool array in input order
+    def contains_many(self, words)->np.ndarray:
+        words = self.__encode_all(words)
+        return np.array([
+            matches == len(word) and not rest and node.is_end
+            for word, (node, matches, rest) 
+            in zip(words, self.__walk_many(words))
+        ], dtype=bool)
+
+    #Number of instances of many words. Returns an int array in input order
+    def count_many(self, words)->np.ndarray:
+        words = self.__encode_all(words)
+        return np.array([
+            self.__count(node) 
+            if matches == len(word) and not rest and node.is_end else 0
+            for word, (node, matches, rest) 
+            in zip(words, self.__walk_many(words))
+        ], dtype=np.int64)
+
+    #`nearest` for many words. Returns a list in input order
+    def nearest_many(self, words, min_matches=1)->list:
+        result = []
+        for node, matches, rest in self.__walk_many(self.__encode_all(words)):
+            if ((node.index or rest) and matches < min_matches
+                or node.best is None):
+                result.append(self.__join([]))
+            else:
+                result.append(self.__word(node.best))
+        return result
+
+    def __contains__(self, word: str, instance: int = 0)->bool:
+        if self.cache is not None:
+            return self.cache.get(
+                ("in", word, instance), self.version, 
+                self.__has, word, instance
+            )
+        return self.__has(word, instance)
+
+    def __has(self, word: str, instance: int)->bool:
+        if self.alphabet is not None:
+            word = self.alphabet.encode(word)
+        parent, matches, rest = self.__walk(word)
+        #The full word must be matched and end at a word end
+        if matches < len(word) or rest or not parent.is_end:
+            return False
+        #Check that it has as many instances as required
+        return (self.__count(parent) >= instance)
     
+    #Yield (word, positions of its instances) for every word end
+    # in preorder
+    def items(self):
+        self.__require_order("items")
+        rank = self.order.rank
+        for node, _, path in self.__traverse(self.root):
+            if node.is_end:
+                yield self.__join(path), [
+                    rank(slot) for slot in self.end_to_index[node]
+                ]
+
+    #Yield (word, number of instances) for every word end in preorder
+    def frequencies(self):
+        for node, _, path in self.__traverse(self.root):
+            if node.is_end:
+                yield self.__join(path), self.__count(node)
+
+    #Get the words ending at the leaves
     def unique(self)->list:
-        return self.__subtree(self.root, "", [])
-
-    #Recursive helper of `popular`
-    def __popular(self, root: Node, 
-                  word: str = "",
-                  max_occurrences: Reference = Reference(0), 
-                  max_word: Reference = Reference(""))->list:
-        #If the rooot is a word end and that word 
-        # occurs with more or the same frequency than the others,
-        # assign `max_word` to it and `max_occurrences` to its occurrence count
-        if root.is_end:
-            occurrences = len(self.end_to_index[root])
-            if occurrences >= max_occurrences.data:
-                max_occurrences.data = occurrences
-                max_word.data = word
-        #Recurse on each of its children down to the last node 
-        # to search for a more popular word
-        for node in root.children:
-            child = node.get()
-            #Recurse on the child with the word
-            # extended by the child's letter
-            self.__popular(
-                child, word+child.letter, 
-                max_occurrences, max_word
-            )
-        return max_word.data
+        return [
+            self.__join(path) for node, _, path in self.__traverse(self.root)
+            if not node.index
+        ]
 
     def popular(self):
-        return self.__popular(
-            self.root, "", 
-            self.Reference(0), 
-            self.Reference("")
-        )
+        if self.cache is not None:
+            return self.cache.get(
+                ("popular",), self.version, self.__popular
+            )
+        return self.__popular()
+
+    def __popular(self)->str:
+        if self.root.best is None:
+            return self.__join([])
+        return self.__word(self.root.best)
 
     #Get the complete strings of all branches to which 
     # a word lies on or could extend to
     def nearest(self, word: str, min_matches=1)->str:
-        base_str = ""
-        matches = 0
-        #Going down the Trie and checking for matches 
-        # using a child-node-searching algorithm.
-        parent = self.root
-        children = parent.children
-        for letter in word:
-            #Iterating through the children 
-            #and checking for a match
-            found = False
-            child = None
-            for node in children:
-                child = node.get()
-                if child.letter != letter:
-                    continue
-                found = True
-                break
-            #If no matching node was found, stop
-            if not found:
-                break
-            #Add to the result and match count
-            base_str += letter
-            matches += 1
-            #Advance the parent and children
-            parent = child
-            children = parent.children
+        if self.cache is not None:
+            return self.cache.get(
+                ("nearest", word, min_matches), self.version, 
+                self.__nearest, word, min_matches
+            )
+        return self.__nearest(word, min_matches)
+
+    def __nearest(self, word: str, min_matches)->str:
+        if self.alphabet is not None:
+            word = self.alphabet.encode(word)
+        #Going down the Trie and checking for matches
+        parent, matches, rest = self.__walk(word)
         #If the last match wasn't a leaf 
-        # and there aren't enough matches, return an empty list
-        if len(parent.children) and matches < min_matches:
-            return ""
-        #Otherwise, return a list of all permutations
+        # and there aren't enough matches, return an empty word.
+        #A match stopping inside a radix label has the rest of it below
+        if (parent.index or rest) and matches < min_matches:
+            return self.__join([])
+        #Otherwise, return the most popular word
         # stemming from the last match
-        return self.__popular(
-            parent, base_str, 
-            self.Reference(0), self.Reference("")
-        )
+        if parent.best is None:
+            return self.__join([])
+        return self.__word(parent.best)
     
+    #Get the `k` most popular words stemming from the end of 
+    # the matched part of `prefix` as (word, count) pairs, 
+    # most popular first.
+    #Follows the same `min_matches` rule as `nearest`
+    def top_k(self, prefix: str, k: int, min_matches=1)->list:
+        parent, matches, rest = self.__walk(self.__encode(prefix))
+        if (parent.index or rest) and matches < min_matches:
+            return []
+        if k <= 0 or parent.best is None:
+            return []
+        #Best first search over subtrees ranked by their most popular
+        # word end, which no other word in them can beat.
+        #A word end popped off the heap is therefore the next result.
+        #Entries are (-count, -push order, node, is word), so ties
+        # go to the latest push and the first result matches `nearest`
+        pushes = itertools.count()
+        heap = [(-self.__count(parent.best), -next(pushes), parent, False)]
+        result = []
+        while heap and len(result) < k:
+            count, _, node, is_word = heapq.heappop(heap)
+            if is_word:
+                result.append((self.__word(node), -count))
+                continue
+            if node.is_end:
+                heapq.heappush(
+                    heap, (-self.__count(node), -next(pushes), node, True)
+                )
+            for child in node.index.values():
+                if child.best is None:
+                    continue
+                heapq.heappush(
+                    heap, 
+                    (-self.__count(child.best), -next(pushes), child, False)
+                )
+        self.__visit(next(pushes), 0, 0)
+        return result
+
+    #Get the words within `max_distance` edits (Levenshtein distance)
+    # of `word` as (word, distance, count) tuples,
+    # closest first, then most popular, then alphabetically.
+    #Each path down the Trie carries the row of the edit distance table
+    # for its letters and branches whose rows are all past 
+    # `max_distance` are cut off
+    def fuzzy(self, word: str, max_distance: int, limit: int = None)->list:
+        word = self.__encode(word)
+        n = len(word)
+        result = []
+        first = list(range(n + 1))
+        if self.root.is_end and first[n] <= max_distance:
+            result.append((self.root, first[n]))
+        stack = [(self.root, first)]
+        visited = 0
+        while stack:
+            root, above = stack.pop()
+            visited += len(root.index)
+            for child in root.index.values():
+                #Row of distances from each prefix of `word`
+                # to the path down to each letter of the child
+                row = above
+                for letter in (child.letter if self.radix 
+                               else (child.letter,)):
+                    previous = row
+                    row = [previous[0] + 1]
+                    for j in range(1, n + 1):
+                        row.append(min(
+                            row[j - 1] + 1, previous[j] + 1,
+                            previous[j - 1] + (word[j - 1] != letter)
+                        ))
+                    if min(row) > max_distance:
+                        break
+                else:
+                    if child.is_end and row[n] <= max_distance:
+                        result.append((child, row[n]))
+                    stack.append((child, row))
+        self.__visit(visited, 0, 0)
+        matches = [
+            (self.__word(node), distance, self.__count(node))
+            for node, distance in result
+        ]
+        matches.sort(key=lambda match: (match[1], -match[2], match[0]))
+        return matches if limit is None else matches[:limit]
+
     #Modification
 
     #Add a word to the Trie while tracking letter frequencies
     def append(self, word: str):
-        #Going down the Trie and appending letters as needed using a 
-        # child-node-searching algorithm
-        parent = self.root
-        children = parent.children
-        for letter in word:
-            #If none of the letters of the current children 
-            # are a match to the current letter, 
-            # insert the letter as a new node
-            found = False
-            child = None
-            for node in children:
-                child = node.get()
-                if child.letter != letter:
-                    continue
-                found = True
-                break
-            #Adding the letter as a child node when 
-            # there are no more nodes to traverse
-            if not found:
-                child = self.Node(letter, LinkedList())
-                parent.children.append(child)
-            #Advance the parent and children
-            parent = child
-            children = parent.children
+        word = self.__encode(word, strict=True)
+        if self.radix:
+            parent = self.__insert(word)
+        else:
+            #Going down the Trie and appending letters as needed
+            parent = self.root
+            for letter in word:
+                child = parent.find(letter)
+                #Adding the letter as a child node when 
+                # there is no matching node to traverse
+                if child is None:
+                    child = parent.add(self.Node(letter))
+                #Advance the parent
+                parent = child
         #Update word end to index list dictionary
-        if not parent.is_end:
-            self.end_to_index[parent] = [self.word_count]
+        if not self.track_order:
+            self.end_to_index[parent] = self.end_to_index.get(parent, 0) + 1
+            parent.is_end = True
+        elif not parent.is_end:
+            self.end_to_index[parent] = [self.order.add(parent)]
             parent.is_end = True
         else:
-            self.end_to_index[parent].append(self.word_count)
+            self.end_to_index[parent].append(self.order.add(parent))
+        self.__count_added(parent)
         #Update word count
         self.word_count += 1
+        self.version += 1
+
+    #Go down a radix mode Trie along `word`, splitting labels the word
+    # branches off inside of and adding a node for the rest of it.
+    #Returns the node ending the word
+    def __insert(self, word: str)->Node:
+        parent = self.root
+        start = 0
+        while start < len(word):
+            child = parent.index.get(word[start])
+            if child is None:
+                return parent.add(self.RadixNode(word[start:]))
+            common = self.__label_match(word, start, child.letter)
+            if common < len(child.letter):
+                child = self.__split(child, common)
+            parent = child
+            start += common
+        return parent
+
+    #Split the label of a radix node after `length` letters.
+    #A new node with the first part takes its place and the node keeps
+    # the rest below it, so it stays the same word end.
+    #Returns the new node
+    def __split(self, node: Node, length: int)->Node:
+        head = self.RadixNode(node.letter[:length])
+        node.parent.replace(node, head)
+        node.letter = node.letter[length:]
+        head.add(node)
+        head.size = node.size
+        head.best = node.best
+        return head
+
+    #Number of instances of a word end
+    def __count(self, node: Node)->int:
+        if self.track_order:
+            return len(self.end_to_index[node])
+        return self.end_to_index[node]
+
+    #Raise for operations that need the order of the instances
+    # when it isn't tracked
+    def __require_order(self, operation: str):
+        if not self.track_order:
+            raise ValueError(
+                f"{operation} needs the order of the words, which isn't "
+                "kept by a Trie with track_order=False"
+            )
+
+    #Get the most popular word end at or below a node 
+    # from the ones of its children.
+    #Ties go to the word end that comes last in preorder
+    def __best_of(self, root: Node)->Node:
+        best = root if root.is_end else None
+        for child in root.index.values():
+            candidate = child.best
+            if candidate is None:
+                continue
+            if best is None or self.__count(candidate) >= self.__count(best):
+                best = candidate
+        return best
+
+    #Update the sizes and most popular word ends on the path to 
+    # the root after an instance of `end` was added
+    def __count_added(self, end: Node):
+        count = self.__count(end)
+        node = end
+        child = None
+        #Most popular word end of `child` before it was updated
+        replaced = None
+        updating = True
+        while node is not None:
+            node.size += 1
+            best = node.best
+            previous = best
+            if updating and best is not end:
+                #Check whether `end` beats the current best,
+                # which may be `node` itself, in the subtree `end` is in
+                # or in a subtree of an earlier or later sibling 
+                if best is None or count > self.__count(best):
+                    wins = True
+                elif count < self.__count(best):
+                    wins = False
+                elif best is node or best is replaced:
+                    wins = True
+                elif child is None:
+                    #Word ends below `end` come after it
+                    wins = False
+                else:
+                    while best.parent is not node:
+                        best = best.parent
+                    wins = best.rank < child.rank
+                if wins:
+                    node.best = end
+                else:
+                    #Anything above that beats the current best
+                    # beats `end` as well
+                    updating = False
+            replaced = previous
+            child = node
+            node = node.parent
+
+    #Update the sizes and most popular word ends from `node` to 
+    # the root after an instance of `end` was removed below it
+    def __count_removed(self, node: Node, end: Node):
+        updating = True
+        while node is not None:
+            node.size -= 1
+            #Only the nodes `end` was the most popular word end of change
+            if updating and node.best is end:
+                node.best = self.__best_of(node)
+            else:
+                updating = False
+            node = node.parent
 
-    #Go to every index greater a deleted one and decrement it
-    def __reindex(self, deleted_index: int):
-        for _, indicies in self.end_to_index.items():
-            for i in range(len(indicies)):
-                if indicies[i] < deleted_index:
+    #Recompute the sizes and most popular word ends of `nodes`, 
+    # where parents come before their children, from the ones of
+    # their children, or of every node
+    def __aggregate(self, nodes: list = None):
+        end_to_index = self.end_to_index
+        #Number of instances a value of `end_to_index` stands for
+        size_of = len if self.track_order else int
+        if nodes is None:
+            nodes = [self.root]
+            for node in nodes:
+                nodes.extend(node.index.values())
+        self.__visit(len(nodes), 0, 0)
+        #Same as `__best_of` with the sizes summed in the same pass
+        for node in reversed(nodes):
+            if node.is_end:
+                best = node
+                top = size = size_of(end_to_index[node])
+            else:
+                best = None
+                top = size = 0
+            for child in node.index.values():
+                size += child.size
+                candidate = child.best
+                if candidate is None:
                     continue
-                indicies[i] -= 1
+                count = size_of(end_to_index[candidate])
+                if count >= top:
+                    best, top = candidate, count
+            node.size = size
+            node.best = best
+
+    #Pause the garbage collector for the duration of a bulk operation.
+    #Bulk operations allocate a lot, and every collection that triggers
+    # rescans all the nodes of the Trie
+    @staticmethod
+    @contextlib.contextmanager
+    def __paused_gc():
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            yield
+        finally:
+            if collecting:
+                gc.enable()
+
+    #Append many words in order.
+    #Repeats of the previous word reuse its end node and, when
+    # `presorted`, each word starts from the end of its common prefix
+    # with the previous word instead of from the root.
+    #Any order gives the same Trie, sorting only makes the reuse pay off
+    def extend(self, sequences, presorted: bool = False):
+        order = self.order
+        end_to_index = self.end_to_index
+        Node = self.Node
+        #Radix nodes don't line up with prefix lengths,
+        # so only repeats are reused in radix mode
+        radix = self.radix
+        track_order = self.track_order
+        #Nodes along the previous word. path[i] is the node after i letters
+        path = [self.root]
+        previous = None
+        parent = None
+        indicies = None
+        added = 0
+        #Nodes gone through by the plain mode loop below,
+        # reported to `profile` at the end
+        visited = deepest = 0
+        #Into an empty Trie, computing the sizes and most popular 
+        # word ends once at the end beats updating them per word
+        aggregate_once = not self.word_count
+        if self.alphabet is not None:
+            sequences = map(
+                functools.partial(self.alphabet.encode, strict=True), 
+                sequences
+            )
+        with self.__paused_gc():
+            try:
+                for word in sequences:
+                    #Repeat of the previous word
+                    if parent is not None and word == previous:
+                        if track_order:
+                            indicies.append(order.add(parent))
+                        else:
+                            end_to_index[parent] += 1
+                        if not aggregate_once:
+                            self.__count_added(parent)
+                        added += 1
+                        continue
+                    if radix:
+                        parent = self.__insert(word)
+                    else:
+                        #Find how much of the previous path can be kept
+                        common = 0
+                        if presorted and previous is not None:
+                            common = self.__common_prefix(
+                                word, previous, len(path) - 1
+                            )
+                            del path[common + 1:]
+                        #Going down the Trie from the end of the common 
+                        # prefix and appending letters as needed
+                        parent = path[common]
+                        for letter in word[common:]:
+                            child = parent.index.get(letter)
+                            if child is None:
+                                child = parent.add(
+                                    Node(letter)
+                                )
+                            parent = child
+                            if presorted:
+                                path.append(child)
+                        visited += len(word) - common
+                        deepest = max(deepest, len(word))
+                    #Update word end to index list dictionary
+                    if not track_order:
+                        end_to_index[parent] = end_to_index.get(parent, 0) + 1
+                        parent.is_end = True
+                    elif not parent.is_end:
+                        indicies = end_to_index[parent] = [order.add(parent)]
+                        parent.is_end = True
+                    else:
+                        indicies = end_to_index[parent]
+                        indicies.append(order.add(parent))
+                    if not aggregate_once:
+                        self.__count_added(parent)
+                    previous = word
+                    added += 1
+            finally:
+                self.__visit(visited, visited, deepest)
+                #Update word count
+                self.word_count += added
+                if added:
+                    self.version += 1
+                if aggregate_once:
+                    self.__aggregate()
+
+    #Append the records of a file split at `delimiter`, in order.
+    #The file is memory-mapped and read `chunksize` bytes at a time, 
+    # each chunk cut at its last delimiter and its records fed to 
+    # `extend` as they are split, so only one chunk of them is held.
+    #The Trie is the same as appending each line of the file without
+    # its delimiter. A delimiter ending the file doesn't start 
+    # another record.
+    #Records are decoded with `encoding` unless the alphabet is "bytes".
+    #`progress` is given a dict of the bytes read so far, the file's 
+    # size, the words added, seconds elapsed, and words and
+    # megabytes per second after each chunk.
+    #Returns the number of words added
+    def ingest(self, path: str, delimiter: bytes = b"\n", 
+               encoding: str = "utf-8", presorted: bool = False,
+               progress=None, chunksize: int = 1 << 24)->int:
+        if not delimiter:
+            raise ValueError("The delimiter can't be empty")
+        raw = self.alphabet is not None and self.alphabet.kind == "bytes"
+        separator = delimiter if raw else delimiter.decode(encoding)
+        added = 0
+        with open(path, "rb") as file:
+            size = os.fstat(file.fileno()).st_size
+            #Empty files can't be mapped
+            if not size:
+                return 0
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            with data:
+                started = time.perf_counter()
+                def records():
+                    nonlocal added
+                    start = 0
+                    while start <= size:
+                        #Cut the chunk at its last delimiter, or past it
+                        # at the next one for records longer than a chunk
+                        stop = start + chunksize
+                        cut = size
+                        if stop < size:
+                            cut = data.rfind(delimiter, start, stop)
+                            if cut == -1:
+                                cut = data.find(delimiter, stop, size)
+                            #Splitting goes left to right, so a delimiter
+                            # overlapping the end of an earlier one 
+                            # (like the last "||" of "|||") isn't
+                            # one it splits at. Step back to the first
+                            # of a run of overlapping ones
+                            while cut != -1 and len(delimiter) > 1:
+                                earlier = data.rfind(
+                                    delimiter, start, cut + len(delimiter) - 1
+                                )
+                                if earlier <= cut - len(delimiter):
+                                    break
+                                cut = earlier
+                            if cut == -1:
+                                cut = size
+                        chunk = data[start:cut]
+                        if not raw:
+                            chunk = chunk.decode(encoding)
+                        words = chunk.split(separator)
+                        del chunk
+                        #A delimiter ending the file doesn't start 
+                        # another record
+                        if cut == size and not words[-1] and (
+                            start or len(words) > 1
+                        ):
+                            words.pop()
+                        yield from words
+                        added += len(words)
+                        start = cut + len(delimiter)
+                        if progress is not None:
+                            seconds = time.perf_counter() - started
+                            done = min(start, size)
+                            progress({
+                                "bytes": done, "size": size, 
+                                "words": added, "seconds": seconds,
+                                "words_per_second": 
+                                    added/seconds if seconds else 0.0,
+                                "mb_per_second": 
+                                    done/2**20/seconds if seconds else 0.0
+                            })
+                self.extend(records(), presorted)
+        return added
+
+    #Append the instances of another Trie or FrozenTrie after the ones
+    # in this one, keeping their order.
+    #Without `track_order` only their numbers are added, and
+    # `other` may be without it as well.
+    #Word ends of `other` come in preorder so consecutive words share
+    # prefixes and new children are added in the order 
+    # appending its words one by one would add them.
+    #Only the sizes and most popular word ends on the paths 
+    # to the word ends of `other` are updated
+    def merge(self, other):
+        order = self.order
+        end_to_index = self.end_to_index
+        Node = self.Node
+        track_order = self.track_order
+        if track_order:
+            #Slot of the instance at position p of `other`
+            base = len(order.live)
+            owners = [None]*len(other)
+            ends = other.items()
+        else:
+            ends = other.frequencies()
+        #Word ends the instances were added to
+        touched = []
+        #Nodes along the previous word. path[i] is the node after i letters
+        path = [self.root]
+        previous = None
+        with self.__paused_gc():
+            for word, positions in ends:
+                word = self.__encode(word, strict=True)
+                if self.radix:
+                    parent = self.__insert(word)
+                else:
+                    if previous is not None:
+                        common = self.__common_prefix(
+                            word, previous, len(path) - 1
+                        )
+                        del path[common + 1:]
+                    #Going down the Trie from the end of the common prefix
+                    # and appending letters as needed
+                    parent = path[-1]
+                    for letter in word[len(path) - 1:]:
+                        child = parent.index.get(letter)
+                        if child is None:
+                            child = parent.add(Node(letter))
+                        path.append(child)
+                        parent = child
+                previous = word
+                touched.append(parent)
+                #Update word end to index list dictionary.
+                #Without `track_order`, `positions` is the number of them
+                if not track_order:
+                    end_to_index[parent] = (
+                        end_to_index.get(parent, 0) + positions
+                    )
+                    parent.is_end = True
+                    continue
+                indicies = [base + position for position in positions]
+                if not parent.is_end:
+                    end_to_index[parent] = indicies
+                    parent.is_end = True
+                else:
+                    end_to_index[parent] += indicies
+                for position in positions:
+                    owners[position] = parent
+            if track_order:
+                for owner in owners:
+                    order.add(owner)
+            self.__aggregate(self.__paths(touched))
+            #Update word count
+            self.word_count += len(other)
+            self.version += 1
+
+    #Get the nodes on the paths from `ends` up to the root,
+    # parents before their children
+    def __paths(self, ends)->list:
+        depths = {self.root: 0}
+        for end in ends:
+            #Climb to a node whose depth is known
+            path = []
+            node = end
+            while node not in depths:
+                path.append(node)
+                node = node.parent
+            depth = depths[node]
+            for node in reversed(path):
+                depth += 1
+                depths[node] = depth
+        return sorted(depths, key=depths.__getitem__)
+
+    #Build a Trie from `sequences` using `workers` processes.
+    #The words are split up by prefix so the subtrees the workers
+    # build don't overlap. The prefixes are picked from the first
+    # `chunksize` words: groups of words with the same first letter
+    # that are too large are split by their first two letters and so
+    # on, so a corpus where most words start the same way (like URLs)
+    # is still spread evenly. Words under none of the prefixes get
+    # a new one, given to the worker with the fewest words so far.
+    #Words are sent to the workers `chunksize` at a time as they are
+    # read, so this process only holds one batch of them, and each
+    # worker adds them to the subtree of their prefix as they come.
+    #This process then makes the nodes above the prefixes, attaches
+    # each subtree whole with the positions of its instances in
+    # `sequences`, and orders the children of the nodes above by 
+    # where they first come up, so the Trie matches one built serially.
+    #It only takes a few steps per word to split them up and one per
+    # node to attach them, instead of one per letter.
+    #Other keyword arguments go to the constructor
+    @classmethod
+    def build_parallel(cls, sequences, workers: int = None, 
+                       chunksize: int = 1 << 16, **options):
+        trie = cls(**options)
+        workers = workers or os.cpu_count() or 1
+        if trie.alphabet is not None:
+            sequences = map(
+                functools.partial(trie.alphabet.encode, strict=True), 
+                sequences
+            )
+        sequences = iter(sequences)
+        sample = list(itertools.islice(sequences, chunksize))
+        #Prefix to the worker building the subtree below it
+        shard_of = cls.__cut(sample, workers)
+        lengths = sorted({len(prefix) for prefix in shard_of})
+        #Prefixes above those of the workers, whose nodes this process
+        # makes, and the positions of the words ending at them
+        spine = {prefix[:length] for prefix in shard_of 
+                 for length in range(1, len(prefix))}
+        ends = dict()
+        #Position of the first word at or below each prefix
+        first = dict()
+        loads = [0]*workers
+        inboxes = [multiprocessing.Queue() for _ in range(workers)]
+        outbox = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(
+                target=_build_shard, 
+                args=(inbox, outbox, trie.radix, trie.track_order), 
+                daemon=True
+            )
+            for inbox in inboxes
+        ]
+        for process in processes:
+            process.start()
+        try:
+            #Prefix to (rest of each word, its position) of each worker
+            batches = [dict() for _ in range(workers)]
+            pending = 0
+            position = -1
+            for position, word in enumerate(
+                itertools.chain(sample, sequences)
+            ):
+                shard = None
+                for length in lengths:
+                    if length > len(word):
+                        break
+                    shard = shard_of.get(word[:length])
+                    if shard is not None:
+                        break
+                if shard is None:
+                    #Follow the prefixes above those of the workers 
+                    # to where the word leaves them
+                    length = 1
+                    while length <= len(word) and word[:length] in spine:
+                        length += 1
+                    if length > len(word):
+                        ends.setdefault(word, []).append(position)
+                        first.setdefault(word, position)
+                        continue
+                    shard = loads.index(min(loads))
+                    shard_of[word[:length]] = shard
+                    if length not in lengths:
+                        bisect.insort(lengths, length)
+                prefix = word[:length]
+                first.setdefault(prefix, position)
+                loads[shard] += 1
+                rests, positions = batches[shard].setdefault(
+                    prefix, ([], [])
+                )
+                rests.append(word[length:])
+                positions.append(position)
+                pending += 1
+                if pending == chunksize:
+                    cls.__send(inboxes, batches)
+                    pending = 0
+            cls.__send(inboxes, batches)
+            del sample
+            for inbox in inboxes:
+                inbox.put(None)
+            count = position + 1
+            owners = [None]*count if trie.track_order else None
+            with trie.__paused_gc():
+                tops = trie.__spine(spine | set(shard_of), first)
+                for _ in processes:
+                    layouts = outbox.get()
+                    if isinstance(layouts, BaseException):
+                        raise layouts
+                    for prefix, layout in layouts:
+                        trie.__attach(layout, tops[prefix], owners)
+            for process in processes:
+                process.join()
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+        for word, positions in ends.items():
+            node = tops[word] if len(word) else trie.root
+            node.is_end = True
+            if trie.track_order:
+                trie.end_to_index[node] = positions
+                for position in positions:
+                    owners[position] = node
+            else:
+                trie.end_to_index[node] = len(positions)
+        #Sizes and most popular word ends of the nodes above 
+        # those of the workers
+        above = sorted(
+            (prefix for prefix in tops if prefix not in shard_of), key=len
+        )
+        trie.__aggregate([trie.root] + [tops[prefix] for prefix in above])
+        if trie.radix:
+            trie.__compress([tops[prefix] for prefix in tops])
+        if trie.track_order:
+            trie.order = trie.OrderIndex(owners)
+        trie.word_count = count
+        if count:
+            trie.version += 1
+        return trie
+
+    #Pick the prefixes `build_parallel` splits words up by from a
+    # `sample` of them and give them out to `shards` workers.
+    #Groups of words with the same prefix are split by the letter 
+    # after the prefix all their words share while they have more 
+    # than a quarter of a shard's share of the words, and the largest
+    # are given out first, each to the worker with the fewest words
+    # so far.
+    #Returns the worker of each prefix
+    @staticmethod
+    def __cut(sample: list, shards: int)->dict:
+        limit = len(sample)/(4*shards)
+        counts = dict()
+        pending = [(0, [word for word in sample if len(word)])]
+        while pending:
+            depth, words = pending.pop()
+            groups = dict()
+            for word in words:
+                if len(word) > depth:
+                    groups.setdefault(word[:depth + 1], []).append(word)
+            for prefix, group in groups.items():
+                #Skip the letters every word of the group shares
+                common = Trie.__common_prefix(
+                    min(group), max(group), sys.maxsize
+                )
+                if len(group) > limit and any(
+                    len(word) > common for word in group
+                ):
+                    pending.append((common, group))
+                else:
+                    counts[prefix] = len(group)
+        shard_of = dict()
+        loads = [(0, shard) for shard in range(shards)]
+        for prefix, count in sorted(
+            counts.items(), key=lambda item: -item[1]
+        ):
+            load, shard = heapq.heappop(loads)
+            shard_of[prefix] = shard
+            heapq.heappush(loads, (load + count, shard))
+        return shard_of
+
+    #Send each worker of `build_parallel` its batch and empty them
+    @staticmethod
+    def __send(inboxes: list, batches: list):
+        for inbox, batch in zip(inboxes, batches):
+            if batch:
+                inbox.put([
+                    (prefix, rests, positions) 
+                    for prefix, (rests, positions) in batch.items()
+                ])
+                batch.clear()
+
+    #Make the nodes of `prefixes` below the root for `build_parallel`,
+    # given the position of the first word at or below each of those
+    # words end at or the workers were given.
+    #The children of each node are added in the order they first
+    # come up. Returns the node of each prefix
+    def __spine(self, prefixes: set, first: dict)->dict:
+        prefixes = sorted(prefixes, key=len, reverse=True)
+        for prefix in prefixes:
+            above = prefix[:-1]
+            if prefix in first and (
+                above not in first or first[prefix] < first[above]
+            ):
+                first[above] = first[prefix]
+        tops = dict()
+        for prefix in sorted(
+            (prefix for prefix in prefixes if prefix in first), 
+            key=lambda prefix: (len(prefix), first[prefix])
+        ):
+            parent = tops[prefix[:-1]] if len(prefix) > 1 else self.root
+            letter = prefix[-1:] if self.radix else prefix[-1]
+            tops[prefix] = parent.add(self.node_type(letter))
+        self.__visit(len(tops), 0, 0)
+        return tops
+
+    #Add the nodes laid out by `_build_shard` below `top`, which takes
+    # the place of their root.
+    #`owners` gets the word end of each position
+    def __attach(self, layout: tuple, top: Node, owners: list):
+        letters, parents, sizes, best, ends = layout
+        node_type = self.node_type
+        nodes = [top]
+        for letter, parent in zip(letters, parents):
+            nodes.append(nodes[parent].add(node_type(letter)))
+        for node, size, index in zip(nodes, sizes, best):
+            node.size = size
+            node.best = nodes[index] if index >= 0 else None
+        self.__visit(len(nodes), 0, 0)
+        end_to_index = self.end_to_index
+        for i, value in ends:
+            node = nodes[i]
+            node.is_end = True
+            end_to_index[node] = value
+            #Without `track_order`, `value` is the number of instances
+            if self.track_order:
+                for position in value:
+                    owners[position] = node
 
     #Delete a word from the Trie
     def delete(self, word: str, prefix: str = "", instance: int = 0)->bool:
-        prefix_end = self.__get_word_end_node(prefix)
-        #Stop if the word isn't in the Trie
-        if prefix_end == None:
-            return False
-        #Going down the Trie and checking for matches 
-        # using a child-node-searching algorithm.
-        parent = prefix_end
-        children = parent.children
-        first_letter_node = None
-        for letter in word:
-            #Iterating through the children 
-            #and checking for a match
-            found = False
-            child = None
-            _node = None
-            for node in children:
-                _node = node
-                child = node.get()
-                if child.letter != letter:
-                    continue
-                found = True
-                break
-            #If no matching node was found, return
-            if not found:
+        word = self.__encode(word)
+        prefix = self.__encode(prefix)
+        if self.radix:
+            #A radix node is already the whole branch below its parent
+            parent, matches, rest = self.__walk(prefix + word)
+            if matches < len(prefix) + len(word) or rest:
                 return False
-            #If the child is the first letter node of the prefix
-            # set the first letter node
-            if children is prefix_end.children:
-                first_letter_node = _node
-            #Otherwise, if  it is a node with 2+ children,
-            # move the prefix end to it
-            if len(child.children) > 1:
-                prefix_end = child
-            #Advance the parent and children
-            parent = child
-            children = parent.children
+            branch, branch_child = parent.parent, parent
+            if branch is None:
+                branch_child = None
+        else:
+            #Going down the Trie and checking for matches
+            # while tracking the lowest node the word's branch
+            # can be detached from without cutting off other words.
+            #The branch may start above the prefix's last node
+            # if nothing else hangs off the prefix
+            parent = self.root
+            branch, branch_child = self.root, None
+            path = prefix + word
+            for matches, letter in enumerate(path):
+                child = parent.find(letter)
+                #If no matching node was found, return
+                if child is None:
+                    self.__visit(matches, matches + 1, matches)
+                    return False
+                #Move the branch point to nodes with 2+ children
+                # or that end another word
+                if (branch_child is None or len(parent.index) > 1 
+                    or parent.is_end):
+                    branch, branch_child = parent, child
+                #Advance the parent
+                parent = child
+            self.__visit(len(path), len(path), len(path))
         #Stop if the parent isn't an end node
         if not parent.is_end:
             return False
-        #Delete the apropriate index from 
-        # the word end to index list dict
-        indicies = self.end_to_index[parent]
         #Return if there is no nth instance of the word
-        if len(indicies) < instance:
+        count = self.__count(parent)
+        if count < instance:
             return False
-        #Otherwise, delete the instance
-        deleted_index = indicies[instance - 1]
-        indicies.pop(instance - 1)
+        if self.track_order:
+            #Delete the apropriate index from 
+            # the word end to index list dict
+            # and free its slot so the positions after it shift down
+            indicies = self.end_to_index[parent]
+            self.order.remove(indicies.pop(instance - 1))
+        else:
+            #Instances aren't told apart without their order
+            self.end_to_index[parent] = count - 1
         #Remove the word end from the word end to indicies
-        # dict and detach the word from the prefix node
+        # dict and detach the word from the branch node
         # if that was the only instance of it
-        if not len(indicies):
+        updated = parent
+        if count == 1:
             self.end_to_index.pop(parent)
+            parent.is_end = False
             #Detach only if the parent has no children
-            if not len(parent.children):
-                prefix_end.children.pop(first_letter_node)
-        #Update all the index lists
-        self.__reindex(deleted_index)
+            if not parent.index and branch_child is not None:
+                branch.remove(branch_child)
+                updated = branch
+        self.__count_removed(updated, parent)
+        #Merge what is left into one node if it no longer branches
+        if self.radix:
+            self.__compress([updated])
         #Decrement word count
         self.word_count -= 1
+        self.version += 1
         return True
                 
-    def __prune_all_below(self, root: Node, indicies = []):
-        #Recurse down to the last node. 
-        #Save any encountered
-        # indicies and delete the node
-        for node in root.children:
-            child = node.get()
-            #Recurse on the child
-            self.__prune_all_below(child, indicies)
-            #Saving indicies
-            if child.is_end:
-                indicies += self.end_to_index[child]
-                #Remove it from the 
-                # word end to index list dict since
-                # it will be deleted 
-                self.end_to_index.pop(child)
-            #Deletion
-            root.children.pop(node)
-        #Return the index list
-        return indicies
-    
-    #Recursive helper of `prune`. Returns how many were deleted
-    def __prune(self, depth_to_count: list, 
-                root: Node, 
-                min_index_count: int, min_bias: float,
-                curr_freq: Reference = Reference(0), 
-                depth=0)->int:
-        #If there are no children
-        # set current frequency to 0 because 
-        # it must be based on the frequencies of the children.
-        #Then return
-        if not len(root.children):
-            curr_freq.data = 0 
-            return
-        #Save the frequencies of the children in an array that will be populated
-        # during iteration through the children
-        frequencies = []
-        #Track if any are deleted
-        some_deleted = False
-        #Recursively iterate over the Trie and populate `frequencies`
-        for node in root.children:
-            child = node.get()
-            #Recurse on the child
-            # with an incremented depth
-            _some_deleted = self.__prune(
-                depth_to_count, child,
-                min_index_count, min_bias,
-                curr_freq,
-                depth+1
-            )
-            some_deleted = (some_deleted or _some_deleted)
-            #Add to the frequency with the current child's frequency
-            # if it is a word end
-            if child.is_end:
-                curr_freq.data += len(self.end_to_index[child])
-            #Append the current frequency to `frequencies`
-            frequencies.append(curr_freq.data)
-        #Check for the validity of each node and delete if it
-        # is invalid
-        n_children = sum(frequencies)
-        base_proportion = 1/len(frequencies)
-        min_proportion = base_proportion + min_bias
-        if min_proportion > 1:
-            min_proportion = 1
-        # Track the number of vacated indicies(explained later)
-        #  so it can be subtracted from `n_children` later
-        num_vacated = 0
-        # Track frequency index
-        i = 0
-        # Iterating and checking/deleting
-        for node in root.children:
-            child = node.get()
-            #Check that the letter count at
-            # this depth is acceptable
-            valid_depth_count = (depth_to_count[depth] >= min_index_count)
-            #If the depth count is invalid,
-            # delete all its children,
-            # vacate the child's index data to the root 
-            #  if its a word end,
-            # and then delete the child itself
-            if not valid_depth_count:
-                child = node.get()
-                #Vacate its index data
-                # and remove it from the end to indicies dict
-                # if its a word end
-                if child.is_end:
-                    #Increment `num_vacated`
-                    num_vacated += 1
-                    #Vacating. Only vacate if the 
-                    # root isn't the Trie root
-                    if not root is self.root:
-                        indicies = self.end_to_index[child]
-                        if not root.is_end:
-                            self.end_to_index[root] = indicies
-                            root.is_end = True
-                        else:
-                            self.end_to_index[root] += indicies
-                    #Deletion from the word end to index list dict
-                    self.end_to_index.pop(child)
-                #Remove it from the children
-                root.children.pop(node)
-                #Update deletion flag
-                some_deleted = True
-                #Incrememnt i and continue
-                i += 1 
-                continue
-            #Check that
-            # this letter's frequency relative to the other 
-            # children is acceptable
-            valid_frequency = (frequencies[i]/n_children >= min_proportion)
-            #If the frequency is invalid, 
-            # delete the child and all below it.
-            #Take all the indicies that were in the lower nodes and give it
-            # to the root
-            if not valid_frequency:
-                #Deleting all below the child
-                indicies = self.__prune_all_below(child, [])
-                #Add the number
-                #If the child is a word end,
-                # add its indicies to `indicies` 
-                # and delete it from the word end to index list dict
-                if child.is_end:
-                    indicies += self.end_to_index[child]
-                    self.end_to_index.pop(child)
-                #Add to `num_vacated`
-                num_vacated += len(indicies)
-                #Saving the indicies in the root
-                if len(indicies) and not root is self.root:
-                    if not root.is_end:
-                        self.end_to_index[root] = indicies
-                        root.is_end = True
-                    else:
-                        self.end_to_index[root] += indicies
-                #Deleting the child
-                root.children.pop(node)
-                #Update the deletion flag
-                some_deleted = True
-            #Increment i
-            i += 1
-        #Subtract out the number of vacations
-        n_children -= num_vacated
-        #Set the current frequency to `n_children`
-        # so that the previous call gets the right frequency
-        curr_freq.data = n_children
-        return some_deleted
-    
     #Rebuild the word end to index list dict
+    # so the indicies are the positions 0 to n-1 again
     def rebuild_index(self):
-        #Tuple like class with a less than comparator
-        # for less than comparison
-        class Tuple:
-            def __init__(self, data=[]):
-                self.data = data
-
-            def __lt__(self, other)->bool:
-                return self.data[0] < other.data[0]
-            
-            def __iter__(self):
-                return self.data.__iter__()
-            
-            def __next__(self):
-                return self.data.__next__()
-            
-        #Gather all indicies, pointers 
-        # to the letter they are mapped to,
-        # and indicies of where in their list they appaer
-        # into a list
-        indicies_and_data = []
-        for end_node, indicies in self.end_to_index.items():
-            for i in range(len(indicies)):
-                to_append = Tuple([indicies[i], end_node, i])
-                indicies_and_data.append(to_append)
+        self.__require_order("rebuild_index")
+        self.version += 1
+        ends = list(self.end_to_index.items())
+        lengths = np.fromiter(
+            (len(indicies) for _, indicies in ends), 
+            dtype=np.int64, count=len(ends)
+        )
         #Update word count
-        self.word_count = len(indicies_and_data)
-        #Sort the list
-        indicies_and_data = np.sort(indicies_and_data)
+        self.word_count = int(lengths.sum())
+        slots = np.fromiter(
+            itertools.chain.from_iterable(
+                indicies for _, indicies in ends
+            ), 
+            dtype=np.int64, count=self.word_count
+        )
+        #The new index of every instance is the rank of its current one
+        order = np.argsort(slots, kind="stable")
+        ranks = np.empty(self.word_count, dtype=np.int64)
+        ranks[order] = np.arange(self.word_count)
         #Replace the indices associated with each end node
         # with the appropriate indicies
-        for i in range(len(indicies_and_data)):
-            _, end_node, list_index = indicies_and_data[i]
-            self.end_to_index[end_node][list_index] = i
+        start = 0
+        for (_, indicies), stop in zip(ends, np.cumsum(lengths).tolist()):
+            indicies[:] = ranks[start:stop].tolist()
+            start = stop
+        #Every slot is now its own position
+        owners = np.repeat(np.arange(len(ends)), lengths)[order]
+        self.order = self.OrderIndex(
+            [ends[i][0] for i in owners.tolist()]
+        )
         
     #Prune the tree of depths with too few letters
     # and letters that don't appear frequently 
     # enough among the children of their parent letters.
+    #The indicies of a removed branch are vacated to the node 
+    # it hung from, or dropped if that is the root.
+    #Works on a level order snapshot of the Trie in NumPy arrays.
+    #In radix mode only the first letter of a label can fail the
+    # frequency check, since the others are the only child of the one
+    # before, and depths with too few letters are all below the ones
+    # with enough. So labels running past the last depth with enough
+    # letters are split there, and every node is then kept or removed
+    # whole. What is left is merged back after
     def prune(self, min_index_vote: float, min_bias: float = 0):
-        depth_counts = self.depth_counts()
-        some_deleted = self.__prune(
-            depth_counts, self.root, 
-            min_index_vote*self.word_count, min_bias,
-            self.Reference(0), 0
+        if not self.radix:
+            self.__prune(min_index_vote, min_bias)
+            return
+        kept = 0
+        for count in self.depth_counts():
+            if count < min_index_vote*self.word_count:
+                break
+            kept += 1
+        self.__split_at(kept)
+        try:
+            self.__prune(min_index_vote, min_bias)
+        finally:
+            nodes = [self.root]
+            for node in nodes:
+                nodes.extend(node.index.values())
+            self.__compress(nodes)
+
+    def __prune(self, min_index_vote: float, min_bias: float):
+        #Level order snapshot. Parents come before their children
+        # and each level is a contiguous id range
+        nodes = [self.root]
+        parent = [-1]
+        level = [0]
+        for i, node in enumerate(nodes):
+            children = node.index.values()
+            nodes.extend(children)
+            parent += [i]*len(children)
+            level += [level[i] + 1]*len(children)
+        n = len(nodes)
+        self.__visit(n, 0, level[-1])
+        if n == 1:
+            return
+        parent = np.array(parent, dtype=np.int64)
+        level = np.array(level, dtype=np.int64)
+        levels = np.searchsorted(level, np.arange(1, level[-1] + 2))
+        #Depth of the last letter of each node
+        depth = level
+        if self.radix:
+            depth = np.zeros(n, dtype=np.int64)
+            lengths = np.fromiter(
+                (len(node.letter) for node in nodes), 
+                dtype=np.int64, count=n
+            )
+            for start, stop in zip(levels[:-1], levels[1:]):
+                depth[start:stop] = (
+                    depth[parent[start:stop]] + lengths[start:stop]
+                )
+        #Each node's frequency is the number of instances at or below it
+        sizes = np.fromiter(
+            (node.size for node in nodes), dtype=np.int64, count=n
+        )
+        counts = np.fromiter(
+            (self.__count(node) if node.is_end else 0 for node in nodes), 
+            dtype=np.int64, count=n
+        )
+        fanout = np.bincount(parent[1:], minlength=n)
+        child = np.arange(1, n)
+        above = parent[1:]
+        #Number of instances at each depth (`depth_counts`).
+        #Each node counts at the depths of the letters of its label,
+        # from the one below its parent's last letter to its own last
+        depth_to_count = np.cumsum(
+            np.bincount(depth[above], weights=sizes[1:], 
+                        minlength=depth.max() + 1)
+            - np.bincount(depth[1:], weights=sizes[1:], 
+                          minlength=depth.max() + 1)
+        )
+        #Check that the letter count at the depth of each child's
+        # first letter is acceptable
+        valid_depth_count = (
+            depth_to_count[depth[above]] >= min_index_vote*self.word_count
         )
+        #Check that each child's frequency relative to 
+        # the other children of its parent is acceptable
+        n_children = (sizes - counts)[above]
+        min_proportion = np.minimum(1/fanout[above] + min_bias, 1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            valid_frequency = (
+                (n_children == 0) 
+                | (sizes[child]/n_children >= min_proportion)
+            )
+        removed = np.zeros(n, dtype=bool)
+        removed[1:] = ~(valid_depth_count & valid_frequency)
+        if not removed.any():
+            return
+        self.version += 1
+        #Going down one level at a time, a node survives if its parent
+        # survives and it isn't removed.
+        #The indicies of each node end up at its lowest surviving 
+        # ancestor (or itself)
+        surviving = np.ones(n, dtype=bool)
+        target = np.arange(n)
+        for start, stop in zip(levels[:-1], levels[1:]):
+            surviving[start:stop] = (
+                surviving[parent[start:stop]] & ~removed[start:stop]
+            )
+            target[start:stop] = np.where(
+                surviving[start:stop], 
+                target[start:stop], target[parent[start:stop]]
+            )
+        #Vacate the indicies of word ends that don't survive.
+        #The ones reaching the root are dropped
+        moved = np.flatnonzero((counts > 0) & ~surviving)
+        vacated = set()
+        for i, to in zip(moved.tolist(), target[moved].tolist()):
+            indicies = self.end_to_index.pop(nodes[i])
+            if not to:
+                continue
+            root = nodes[to]
+            if not root.is_end:
+                self.end_to_index[root] = indicies
+                root.is_end = True
+            else:
+                self.end_to_index[root] += indicies
+            vacated.add(root)
+        if self.track_order:
+            for root in vacated:
+                self.end_to_index[root].sort()
+        #Detach the highest removed nodes from their surviving parents
+        cut = np.flatnonzero(removed & surviving[parent])
+        for root, i in zip(parent[cut].tolist(), cut.tolist()):
+            nodes[root].remove(nodes[i])
         #Rebuild the index after all the pruning
-        # if any were deleted
-        if some_deleted:
+        if self.track_order:
             self.rebuild_index()
+        else:
+            self.word_count = sum(self.end_to_index.values())
+        self.__aggregate()
 
-    #Recursive helper of `decompress`
-    def __decompress(self, root: Node, 
-                     word: str = "", result_list: list = [])->list:
-        #If it is a word end node, 
-        # place the result in the list 
-        # at the appropriate indexes
-        if root.is_end:
-            for index in self.end_to_index[root]:
-                result_list[index] = word
-        #Recurse on each of its children down to the last node
-        for node in root.children:
-            child = node.get()
-            #Recurse on the child with the word extended by the child's letter
-            self.__decompress(child, word+child.letter, result_list)
-        return result_list
+    #Split the labels of the radix nodes running past `depth` letters
+    # after their last letter at or above it
+    def __split_at(self, depth: int):
+        crossing = []
+        #Nodes with the number of letters down to their end
+        stack = [(self.root, 0)]
+        while stack:
+            node, reach = stack.pop()
+            for child in node.index.values():
+                end = reach + len(child.letter)
+                if end <= depth:
+                    stack.append((child, end))
+                elif reach < depth:
+                    crossing.append((child, depth - reach))
+        for node, length in crossing:
+            self.__split(node, length)
+
+    #Merge the radix nodes in `nodes` that have one child and don't
+    # end a word into the node below them
+    def __compress(self, nodes: list):
+        for node in nodes:
+            if not self.__merges(node):
+                continue
+            #Only start from the bottom of a chain
+            child, = node.index.values()
+            if self.__merges(child):
+                continue
+            label = child.letter
+            top = node
+            while True:
+                label = top.letter + label
+                if not self.__merges(top.parent):
+                    break
+                top = top.parent
+            child.letter = label
+            top.parent.replace(top, child)
+
+    #Whether a radix node gets merged into its only child
+    @staticmethod
+    def __merges(node: Node)->bool:
+        return (node.parent is not None and not node.is_end 
+                and len(node.index) == 1)
+
+    #Rebuild the word a node ends by following its parents
+    def __word(self, node: Node)->str:
+        letters = []
+        while node.parent is not None:
+            letters.append(node.letter)
+            node = node.parent
+        letters.reverse()
+        return self.__join(letters)
+
+    #Rebuild a word from the letters of the nodes down to its end
+    def __join(self, letters: list):
+        if self.alphabet is None:
+            return "".join(letters)
+        return self.alphabet.join(letters, self.radix)
+
+    #Get the letters of `word` stored in the nodes
+    def __encode(self, word, strict: bool = False):
+        if self.alphabet is None:
+            return word
+        return self.alphabet.encode(word, strict)
+
+    #`__encode` for many words. Returns a list
+    def __encode_all(self, words)->list:
+        if self.alphabet is None:
+            return list(words)
+        return [self.alphabet.encode(word) for word in words]
+
+    #Yield the words at positions [start, stop) in insertion order.
+    #Only the current word is held in memory
+    def iter_decompress(self, start: int = 0, stop: int = None):
+        self.__require_order("iter_decompress")
+        start, stop, _ = slice(start, stop).indices(self.word_count)
+        if start >= stop:
+            return
+        order = self.order
+        slot = order.select(start)
+        remaining = stop - start
+        #Go through the slots from the first one in range
+        # skipping the removed ones
+        while remaining:
+            if order.live[slot]:
+                yield self.__word(order.owners[slot])
+                remaining -= 1
+            slot += 1
 
     #Get all the words out of the tree
-    def decompress(self)->list:
+    # or only those at positions [start, stop)
+    def decompress(self, start: int = 0, stop: int = None)->list:
+        self.__require_order("decompress")
+        if start or (stop is not None and stop < self.word_count):
+            return list(self.iter_decompress(start, stop))
         words = ["" for _ in range(self.word_count)]
-        self.__decompress(self.root, "", words)
+        rank = self.order.rank
+        #Place each word at the positions of its instances
+        for node, _, path in self.__traverse(self.root):
+            if node.is_end:
+                word = self.__join(path)
+                for slot in self.end_to_index[node]:
+                    words[rank(slot)] = word
         return words
+
+#Worker of `Trie.build_parallel`.
+#Takes batches of (prefix, rest of each word, its position) from
+# `inbox` until None, with the words already encoded, adding the 
+# rests to a Trie for each prefix as they come. Then puts them all 
+# on `outbox` as (prefix, layout) pairs, or the error it ran into.
+#Layouts are the nodes in level order as (letters, parent ids, sizes,
+# most popular word end ids or -1, (word end id, positions or count)
+# pairs), where the root, id 0, stands for the prefix and has no
+# letter or parent
+def _build_shard(inbox, outbox, radix: bool, track_order: bool):
+    try:
+        #Prefix to (Trie of the rests, positions of its instances)
+        groups = dict()
+        #Building and laying the nodes out allocate a lot
+        with Trie._Trie__paused_gc():
+            for batch in iter(inbox.get, None):
+                for prefix, rests, positions in batch:
+                    group = groups.get(prefix)
+                    if group is None:
+                        groups[prefix] = (Trie(
+                            rests, radix=radix, track_order=track_order
+                        ), positions)
+                    else:
+                        group[0].extend(rests)
+                        group[1].extend(positions)
+            layouts = []
+            while groups:
+                prefix, (trie, positions) = groups.popitem()
+                nodes = [trie.root]
+                parents = []
+                for i, node in enumerate(nodes):
+                    children = node.index.values()
+                    nodes.extend(children)
+                    parents += [i]*len(children)
+                ids = {node: i for i, node in enumerate(nodes)}
+                #Slots of a Trie nothing was deleted from are 
+                # the order its words came in
+                layouts.append((prefix, (
+                    [node.letter for node in nodes[1:]], parents,
+                    [node.size for node in nodes],
+                    [-1 if node.best is None else ids[node.best] 
+                     for node in nodes],
+                    [(ids[node], [positions[slot] for slot in value] 
+                      if track_order else value) 
+                     for node, value in trie.end_to_index.items()]
+                )))
+        outbox.put(layouts)
+    except BaseException as error:
+        outbox.put(error)
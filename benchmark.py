@@ -0,0 +1,268 @@
+from Trie import Trie
+import argparse
+import datetime
+import gc
+import itertools
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+#Benchmarks of the Trie operations on synthetic corpora.
+#Every run is seeded so the same arguments time the same work, and
+# the results are written as JSON so runs can be compared:
+#   python benchmark.py --sizes 1e4 1e5 1e6 --output before.json
+#   python benchmark.py --sizes 1e4 1e5 1e6 --output after.json
+#   python benchmark.py --compare before.json after.json
+
+#Corpora. Each one takes a number of words and a seeded generator
+
+#Pronounceable words with Zipf distributed frequencies,
+# like the words of natural language text
+def natural_words(size: int, rng: random.Random)->list:
+    onsets = ["", "b", "c", "d", "f", "g", "h", "l", "m", "n", "p", "r",
+              "s", "t", "v", "w", "br", "ch", "cl", "pr", "sh", "st", "th"]
+    vowels = ["a", "e", "i", "o", "u", "ai", "ea", "ou"]
+    codas = ["", "", "n", "r", "s", "t", "ng", "st", "ck"]
+    vocabulary = {
+        "".join(
+            rng.choice(onsets) + rng.choice(vowels) + rng.choice(codas)
+            for _ in range(rng.randint(1, 4))
+        )
+        for _ in range(min(size, 50000))
+    }
+    return zipf_sample(sorted(vocabulary), size, 1.0, rng)
+
+#Long, mostly unique keys sharing a few prefixes, like URLs
+def long_keys(size: int, rng: random.Random)->list:
+    hosts = [f"https://{name}.example.com/" for name in
+             ("www", "api", "static", "cdn", "docs")]
+    segment = "abcdefghijklmnopqrstuvwxyz0123456789"
+    return [
+        rng.choice(hosts) + "/".join(
+            "".join(rng.choices(segment, k=rng.randint(3, 12)))
+            for _ in range(rng.randint(2, 6))
+        )
+        for _ in range(size)
+    ]
+
+#Short random keys with strongly skewed frequencies
+def zipf_keys(size: int, rng: random.Random)->list:
+    vocabulary = {
+        "".join(rng.choices("abcdefghij", k=rng.randint(2, 10)))
+        for _ in range(max(size // 10, 1))
+    }
+    return zipf_sample(sorted(vocabulary), size, 1.3, rng)
+
+#Keys over thousands of different letters, so nodes have many children
+def wide_alphabet(size: int, rng: random.Random)->list:
+    alphabet = [chr(0x4E00 + i) for i in range(20000)]
+    return [
+        "".join(rng.choices(alphabet, k=rng.randint(2, 8)))
+        for _ in range(size)
+    ]
+
+CORPORA = {
+    "natural": natural_words,
+    "long": long_keys,
+    "zipf": zipf_keys,
+    "wide": wide_alphabet,
+}
+
+#Draw `size` words where the word of rank r comes up
+# in proportion to 1/r**exponent
+def zipf_sample(vocabulary: list, size: int, exponent: float,
+                rng: random.Random)->list:
+    rng.shuffle(vocabulary)
+    weights = itertools.accumulate(
+        1/rank**exponent for rank in range(1, len(vocabulary) + 1)
+    )
+    return rng.choices(vocabulary, cum_weights=list(weights), k=size)
+
+#Measurement
+
+#Time one call with the garbage left by the previous one collected
+def timed(function, *args)->float:
+    gc.collect()
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+#Bytes allocated by a call that are still held after it,
+# and the most held at once during it
+def traced(function, *args)->tuple:
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = function(*args)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return current, peak
+
+#Operations. Each one takes the Trie and the words it times
+
+def append_all(trie: Trie, words: list):
+    for word in words:
+        trie.append(word)
+
+def contains_all(trie: Trie, words: list):
+    for word in words:
+        word in trie
+
+def nearest_all(trie: Trie, words: list):
+    for word in words:
+        trie.nearest(word)
+
+def popular_all(trie: Trie, words: list):
+    for _ in words:
+        trie.popular()
+
+def delete_all(trie: Trie, words: list):
+    for word in words:
+        trie.delete(word)
+
+#Time every operation on one corpus.
+#The operations run in this order on one Trie, ending with the
+# ones that change it, so each Trie is only built twice
+def bench_corpus(name: str, size: int, args)->tuple:
+    rng = random.Random(f"{args.seed}/{name}/{size}")
+    words = CORPORA[name](size, rng)
+    options = {"radix": args.radix, "track_order": not args.count_only}
+    queries = rng.choices(words, k=min(args.queries, size))
+    #Half the lookups miss
+    for i in range(0, len(queries), 2):
+        queries[i] = queries[i][::-1] + queries[i][:1]
+    prefixes = [word[:max(len(word)//2, 1)] for word in queries]
+    removed = rng.sample(words, min(args.queries, size))
+    results = []
+    def record(operation: str, seconds: float, items: int):
+        results.append({
+            "corpus": name, "size": size, "operation": operation,
+            "items": items, "seconds": seconds,
+            "ns_per_item": seconds/items*1e9 if items else None,
+        })
+        print(f"{name:>8} {size:>9} {operation:>14} {seconds:10.4f}s "
+              f"{items:>9} items", file=sys.stderr)
+    trie = Trie(**options)
+    record("append", timed(append_all, trie, words), size)
+    del trie
+    trie = Trie(**options)
+    record("extend", timed(trie.extend, words), size)
+    for operation, function, items in (
+        ("__contains__", contains_all, queries),
+        ("nearest", nearest_all, prefixes),
+        ("popular", popular_all, queries),
+    ):
+        #Queries are timed at their best of `repeat` runs
+        record(operation, min(
+            timed(function, trie, items) for _ in range(args.repeat)
+        ), len(items))
+    record("unique", timed(trie.unique), 1)
+    if trie.track_order:
+        record("decompress", timed(trie.decompress), size)
+    record("delete", timed(delete_all, trie, removed), len(removed))
+    if trie.track_order:
+        record("rebuild_index", timed(trie.rebuild_index), len(trie))
+    record("prune", timed(trie.prune, args.prune_vote, args.prune_bias), 1)
+    del trie
+    #Memory is measured on a separate build since tracing slows it down
+    held, peak = traced(lambda: Trie(words, **options))
+    memory = {
+        "corpus": name, "size": size,
+        "trie_bytes": held, "build_peak_bytes": peak,
+    }
+    return results, memory
+
+def run(args):
+    report = {
+        "meta": {
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version,
+            "platform": platform.platform(),
+            "arguments": vars(args),
+        },
+        "results": [],
+        "memory": [],
+    }
+    for name in args.corpora:
+        for size in args.sizes:
+            results, memory = bench_corpus(name, size, args)
+            report["results"] += results
+            report["memory"].append(memory)
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=1)
+    print(f"Results written to {args.output}", file=sys.stderr)
+
+#Print the ratio of the times of each operation in two result files
+def compare(before_path: str, after_path: str):
+    def load(path):
+        with open(path) as file:
+            report = json.load(file)
+        return report, {
+            (result["corpus"], result["size"], result["operation"]): result
+            for result in report["results"]
+        }
+    before, before_times = load(before_path)
+    after, after_times = load(after_path)
+    print(f"{'corpus':>8} {'size':>9} {'operation':>14} "
+          f"{'before':>10} {'after':>10} {'ratio':>7}")
+    for key, result in after_times.items():
+        if key not in before_times:
+            continue
+        old, new = before_times[key]["seconds"], result["seconds"]
+        print(f"{key[0]:>8} {key[1]:>9} {key[2]:>14} "
+              f"{old:10.4f} {new:10.4f} {new/old if old else 0:7.2f}")
+    print()
+    print(f"{'corpus':>8} {'size':>9} {'trie MB before':>15} "
+          f"{'after':>10} {'peak MB before':>15} {'after':>10}")
+    old_memory = {
+        (memory["corpus"], memory["size"]): memory
+        for memory in before["memory"]
+    }
+    for memory in after["memory"]:
+        old = old_memory.get((memory["corpus"], memory["size"]))
+        if old is None:
+            continue
+        print(f"{memory['corpus']:>8} {memory['size']:>9} "
+              f"{old['trie_bytes']/2**20:15.1f} "
+              f"{memory['trie_bytes']/2**20:10.1f} "
+              f"{old['build_peak_bytes']/2**20:15.1f} "
+              f"{memory['build_peak_bytes']/2**20:10.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark Trie operations on synthetic corpora"
+    )
+    parser.add_argument(
+        "--sizes", nargs="+", default=[10**4, 10**5],
+        type=lambda size: int(float(size)),
+        help="numbers of words, like 1e4 1e5 1e6 1e7"
+    )
+    parser.add_argument(
+        "--corpora", nargs="+", default=list(CORPORA), choices=CORPORA
+    )
+    parser.add_argument("--queries", type=int, default=10**5,
+                        help="most lookups and deletes per corpus")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="runs of each query operation")
+    parser.add_argument("--prune-vote", type=float, default=0.01)
+    parser.add_argument("--prune-bias", type=float, default=0)
+    parser.add_argument("--radix", action="store_true")
+    parser.add_argument("--count-only", action="store_true",
+                        help="build with track_order=False")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"),
+                        help="compare two result files instead of running")
+    args = parser.parse_args()
+    if args.compare:
+        compare(*args.compare)
+    else:
+        run(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,569 @@
+from Trie import Trie
+import random
+import threading
+import numpy as np
+import pytest
+
+#Checks of the Trie against brute force over the list of its instances
+
+#Random words over a small alphabet so they share prefixes and repeat
+def random_words(rng: random.Random, size: int, letters: str = "abc")->list:
+    return [
+        "".join(rng.choices(letters, k=rng.randint(0, 5)))
+        for _ in range(size)
+    ]
+
+#Check the sizes and most popular word ends of every node through
+# `depth_counts`, `nearest` and `top_k`.
+#The most popular word under a prefix is the one with the most
+# instances, ties going to the last of them in preorder
+def check_aggregates(trie: Trie):
+    frequencies = list(trie.frequencies())
+    #Every instance has a letter at each depth up to its length
+    depth_counts = []
+    for word, count in frequencies:
+        for depth in range(len(word)):
+            if depth == len(depth_counts):
+                depth_counts.append(0)
+            depth_counts[depth] += count
+    assert trie.depth_counts() == depth_counts
+    prefixes = {word[:i] for word, _ in frequencies
+                for i in range(len(word) + 1)}
+    for prefix in prefixes:
+        below = [(word, count) for word, count in frequencies
+                 if word.startswith(prefix)]
+        top = max(count for _, count in below)
+        best = [word for word, count in below if count == top][-1]
+        assert trie.nearest(prefix, 0) == best
+        counts = [count for _, count in trie.top_k(prefix, 3, 0)]
+        assert counts == sorted(
+            (count for _, count in below), reverse=True
+        )[:3]
+        assert trie.top_k(prefix, 1, 0)[0][0] == best
+    if not frequencies:
+        assert trie.popular() == ""
+
+#Which instance of a word `delete` removes. 0 is the last one
+def delete_model(words: list, word: str, instance: int)->bool:
+    positions = [i for i, other in enumerate(words) if other == word]
+    if not positions or len(positions) < instance:
+        return False
+    del words[positions[instance - 1]]
+    return True
+
+@pytest.mark.parametrize("radix", [False, True])
+def test_ties_go_to_the_last_word_end_in_preorder(radix):
+    trie = Trie(radix=radix)
+    #Children are in the order they were added, so the preorder
+    # is "b", "ba", "a"
+    for word, popular in (("b", "b"), ("a", "a"), ("b", "b"), ("a", "a"),
+                          ("ba", "a"), ("ba", "a"), ("ba", "ba"), 
+                          ("b", "ba"), ("a", "a")):
+        trie.append(word)
+        assert trie.popular() == popular
+    assert trie.nearest("b") == "ba"
+
+@pytest.mark.parametrize("radix", [False, True])
+def test_a_word_beaten_below_the_root_can_still_win_above(radix):
+    trie = Trie(["ab", "ab", "ac", "ac", "ac", "b", "b"], radix=radix)
+    #"ab" ties "ac" under "a" but comes first, and loses to it there
+    trie.append("ab")
+    assert trie.nearest("a") == "ac"
+    assert trie.popular() == "ac"
+    trie.append("ab")
+    assert trie.nearest("a") == "ab"
+    assert trie.popular() == "ab"
+    check_aggregates(trie)
+
+@pytest.mark.parametrize("radix", [False, True])
+@pytest.mark.parametrize("seed", range(20))
+def test_aggregates_after_appends_and_deletes(radix, seed):
+    rng = random.Random(seed)
+    trie = Trie(radix=radix)
+    words = []
+    for word in random_words(rng, 60):
+        trie.append(word)
+        words.append(word)
+        check_aggregates(trie)
+    #Incremental updates of a Trie that isn't empty
+    more = random_words(rng, 30)
+    trie.extend(more, presorted=seed % 2 == 0)
+    words += more
+    check_aggregates(trie)
+    for word in random_words(rng, 40):
+        instance = rng.randint(0, 3)
+        assert trie.delete(word, instance=instance) == delete_model(
+            words, word, instance
+        )
+        check_aggregates(trie)
+    assert trie.decompress() == words
+
+#Start empty or from slots given at once, like `rebuild_index` does
+@pytest.mark.parametrize("start", [0, 1, 7, 300])
+def test_order_index_rank_and_select_after_removes(start):
+    rng = random.Random(start)
+    order = Trie.OrderIndex([-slot for slot in range(start)])
+    live = list(range(start))
+    owners = {slot: -slot for slot in live}
+    for step in range(2000):
+        if live and rng.random() < 0.4:
+            slot = live.pop(rng.randrange(len(live)))
+            order.remove(slot)
+        else:
+            slot = order.add(step)
+            owners[slot] = step
+            live.append(slot)
+        if step % 50 == 1:
+            live.sort()
+            assert len(order) == len(live)
+            for position, slot in enumerate(live):
+                assert order.rank(slot) == position
+                assert order.select(position) == slot
+                assert order.owners[slot] == owners[slot]
+
+@pytest.mark.parametrize("seed", range(10))
+def test_positions_after_deletes(seed):
+    rng = random.Random(seed)
+    words = random_words(rng, 200)
+    trie = Trie(words)
+    for word in random_words(rng, 80):
+        instance = rng.randint(0, 2)
+        assert trie.delete(word, instance=instance) == delete_model(
+            words, word, instance
+        )
+        trie.append(word)
+        words.append(word)
+    assert trie.decompress() == words
+    for start in range(0, len(words), 17):
+        assert trie.decompress(start, start + 9) == words[start:start + 9]
+    positions = dict()
+    for i, word in enumerate(words):
+        positions.setdefault(word, []).append(i)
+    assert dict(trie.items()) == positions
+    trie.rebuild_index()
+    assert trie.decompress() == words
+
+#Instances left by `prune`, in order. A node is removed if its depth
+# has too few letters or it has too small a share of the instances
+# below its parent that don't end there. Instances move up to the
+# longest prefix with no removed node on the way, or are dropped
+# if there is none, except for the empty word at the root
+def prune_model(words: list, min_index_vote: float, min_bias: float)->list:
+    def size(prefix):
+        return sum(word.startswith(prefix) for word in words)
+    def removed(prefix):
+        letters = sum(len(word) >= len(prefix) for word in words)
+        if letters < min_index_vote*len(words):
+            return True
+        parent = prefix[:-1]
+        fanout = len({word[len(parent)] for word in words
+                      if len(word) > len(parent)
+                      and word.startswith(parent)})
+        share = size(prefix)/(size(parent) - words.count(parent))
+        return share < min(1/fanout + min_bias, 1)
+    result = []
+    for word in words:
+        kept = 0
+        while kept < len(word) and not removed(word[:kept + 1]):
+            kept += 1
+        if kept or not word:
+            result.append(word[:kept])
+    return result
+
+@pytest.mark.parametrize("radix", [False, True])
+@pytest.mark.parametrize("seed", range(30))
+def test_prune_matches_brute_force(radix, seed):
+    rng = random.Random(seed)
+    words = random_words(rng, rng.randint(1, 60), "abc"[:rng.randint(1, 3)])
+    min_index_vote = rng.choice([0, 0.05, 0.2, 0.4, 0.7])
+    min_bias = rng.choice([0, 0.02, 0.1])
+    trie = Trie(words, radix=radix)
+    trie.prune(min_index_vote, min_bias)
+    pruned = prune_model(words, min_index_vote, min_bias)
+    assert trie.decompress() == pruned
+    assert len(trie) == len(pruned)
+    check_aggregates(trie)
+
+#Deleting the only word below a chain of nodes that end no word
+# removes the whole chain in both modes
+@pytest.mark.parametrize("seed", range(20))
+def test_delete_removes_dead_branches_in_both_modes(seed):
+    rng = random.Random(seed)
+    words = random_words(rng, 30, "ab")
+    plain, radix = Trie(words), Trie(words, radix=True)
+    for _ in range(60):
+        prefix = random_words(rng, 1, "ab")[0][:3]
+        word = random_words(rng, 1, "ab")[0][:4]
+        instance = rng.randint(0, 2)
+        assert (plain.delete(word, prefix, instance) 
+                == radix.delete(word, prefix, instance))
+        assert sorted(plain.unique()) == sorted(radix.unique())
+        assert sorted(plain.freeze().unique()) == sorted(plain.unique())
+    assert plain.decompress() == radix.decompress()
+    trie = Trie(["abac"])
+    assert trie.delete("", prefix="abac")
+    assert not trie.root.index
+
+#The letters `delete` and `extend` go through are counted by `profile`
+def test_profile_counts_the_walks_of_delete_and_extend():
+    trie = Trie(["a"*50, "b"])
+    records = []
+    with trie.profile(records.append):
+        trie.delete("a"*50)
+        trie.extend(["abc", "abd"])
+    deleted, extended = records
+    assert deleted["nodes"] >= 50 and deleted["depth"] == 50
+    assert extended["nodes"] >= 4 and extended["depth"] == 3
+
+#Words of each kind of alphabet made from random strings over "abc",
+# and a letter outside of each
+ALPHABETS = {
+    None: (lambda word: word, "d"),
+    "bytes": (lambda word: word.encode(), b"d"),
+    "tokens": (lambda word: tuple(2**40*"abc".index(letter) 
+                                  for letter in word), (7,)),
+    ("a", "b", "c"): (lambda word: word, "d"),
+    (5, 9, 700): (lambda word: tuple((5, 9, 700)["abc".index(letter)]
+                                     for letter in word), (6,)),
+}
+
+@pytest.mark.parametrize("radix", [False, True])
+@pytest.mark.parametrize("kind", list(ALPHABETS))
+def test_batch_lookups_of_each_alphabet_match_the_trie(kind, radix, tmp_path):
+    rng = random.Random(str(kind))
+    make, outside = ALPHABETS[kind]
+    words = [make(word) for word in random_words(rng, 80)]
+    trie = Trie(words, radix=radix, alphabet=kind)
+    queries = [make(word) for word in random_words(rng, 60)]
+    queries += [outside, make("ab") + outside]
+    frozen = trie.freeze()
+    trie.save(tmp_path / "trie")
+    for frozen in (frozen, Trie.load(tmp_path / "trie")):
+        assert frozen.contains_many(queries).tolist() == [
+            word in trie for word in queries
+        ]
+        assert frozen.count_many(queries).tolist() == [
+            words.count(word) for word in queries
+        ]
+        assert frozen.nearest_many(queries, 0) == [
+            trie.nearest(word, 0) for word in queries
+        ]
+        assert frozen.decompress() == words
+
+#Letters too large for the keys of the batch lookups, or negative,
+# fall back to walking each word
+@pytest.mark.parametrize("words", [
+    [(2**62, 1), (2**62, 2), (3, 4)], [(-5, 1), (2, 2)]
+])
+def test_batch_lookups_of_any_token(words):
+    frozen = Trie(words, alphabet="tokens").freeze()
+    queries = words + [(3, 5), (2**62,)]
+    assert frozen.contains_many(queries).tolist() == [
+        word in frozen for word in queries
+    ] == [True]*len(words) + [False, False]
+
+@pytest.mark.parametrize("radix", [False, True])
+@pytest.mark.parametrize("seed", range(10))
+def test_frozen_top_k_and_fuzzy_match_the_trie(radix, seed):
+    rng = random.Random(seed)
+    trie = Trie(random_words(rng, 80), radix=radix)
+    frozen = trie.snapshot()
+    for prefix in random_words(rng, 20):
+        k, min_matches = rng.randint(0, 6), rng.randint(0, 2)
+        assert frozen.top_k(prefix, k, min_matches) == trie.top_k(
+            prefix, k, min_matches
+        )
+        distance = rng.randint(0, 3)
+        assert frozen.fuzzy(prefix, distance) == trie.fuzzy(prefix, distance)
+
+#Readers querying the Trie and its snapshots while a writer changes it
+# never see a word that is always there go missing
+def test_readers_and_a_writer_at_once():
+    rng = random.Random(0)
+    words = random_words(rng, 300)
+    always = list(words)
+    more = ["x" + word for word in random_words(rng, 300)]
+    trie = Trie(words, concurrent=True, cache_size=64)
+    errors = []
+    done = threading.Event()
+    def write():
+        try:
+            for word in more:
+                trie.append(word)
+                words.append(word)
+            for word in more[::2]:
+                assert trie.delete(word) == delete_model(words, word, 0)
+        except BaseException as error:
+            errors.append(error)
+        finally:
+            done.set()
+    def read(seed):
+        rng = random.Random(seed)
+        try:
+            while not done.is_set():
+                word = rng.choice(always)
+                assert word in trie
+                assert all(trie.contains_many([word]))
+                assert trie.top_k(word, 1, 0)
+                assert trie.fuzzy(word, 0)[0][0] == word
+                snapshot = trie.snapshot()
+                assert word in snapshot
+                assert len(snapshot.decompress()) == len(snapshot)
+        except BaseException as error:
+            errors.append(error)
+    threads = [threading.Thread(target=read, args=(seed,)) 
+               for seed in range(3)]
+    threads.append(threading.Thread(target=write))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert trie.decompress() == words
+    check_aggregates(trie)
+
+#The iterators of a concurrent Trie run in batches and raise if the
+# Trie changes between them. Those of a snapshot don't
+@pytest.mark.parametrize("name", ["items", "frequencies", "iter_decompress"])
+def test_changing_a_concurrent_trie_during_iteration_raises(name, monkeypatch):
+    monkeypatch.setattr(Trie, "BATCH", 4)
+    trie = Trie(random_words(random.Random(1), 40), concurrent=True)
+    snapshot = trie.snapshot()
+    steps, frozen_steps = getattr(trie, name)(), getattr(snapshot, name)()
+    next(steps)
+    next(frozen_steps)
+    trie.append("new")
+    with pytest.raises(RuntimeError):
+        list(steps)
+    assert [next(getattr(snapshot, name)())] + list(frozen_steps) == list(
+        getattr(snapshot, name)()
+    )
+
+#Same words, instances, order, cached aggregates and children order
+def assert_same(trie: Trie, other: Trie):
+    assert list(trie.frequencies()) == list(other.frequencies())
+    assert len(trie) == len(other)
+    if trie.track_order:
+        assert trie.decompress() == other.decompress()
+    assert trie.memory_report()["nodes"] == other.memory_report()["nodes"]
+    check_aggregates(trie)
+
+@pytest.mark.parametrize("radix", [False, True])
+@pytest.mark.parametrize("track_order", [True, False])
+@pytest.mark.parametrize("seed", range(4))
+def test_merge_matches_appending_the_words(radix, track_order, seed):
+    rng = random.Random(seed)
+    words, more = random_words(rng, 80), random_words(rng, 80)
+    options = {"radix": radix, "track_order": track_order}
+    trie = Trie(words, **options)
+    trie.merge(Trie(more, **options))
+    assert_same(trie, Trie(words + more, **options))
+
+#Most words start the same way for odd seeds, so the shards
+# are split below that prefix
+@pytest.mark.parametrize("radix", [False, True])
+@pytest.mark.parametrize("track_order", [True, False])
+@pytest.mark.parametrize("seed", range(4))
+def test_build_parallel_matches_a_serial_build(radix, track_order, seed):
+    rng = random.Random(seed)
+    words = random_words(rng, 150)
+    if seed % 2:
+        words = ["https://" + word for word in words[:130]] + words[130:]
+    options = {"radix": radix, "track_order": track_order}
+    trie = Trie.build_parallel(
+        iter(words), workers=3, chunksize=rng.choice([7, 40, 1000]), 
+        **options
+    )
+    serial = Trie(words, **options)
+    assert_same(trie, serial)
+    #It keeps working like any other Trie
+    for word in random_words(rng, 30):
+        assert trie.delete(word) == serial.delete(word)
+        trie.append(word[::-1])
+        serial.append(word[::-1])
+    assert_same(trie, serial)
+
+def test_build_parallel_with_an_alphabet():
+    words = [b"", b"ab", b"abc", b"b", b"", b"abd", b"ab"]
+    trie = Trie.build_parallel(words, workers=2, chunksize=2, alphabet="bytes")
+    assert_same(trie, Trie(words, alphabet="bytes"))
+    with pytest.raises(ValueError):
+        Trie.build_parallel(["ab", "ad"], workers=2, alphabet="abc")
+
+#Records of `data` split at `delimiter` like `ingest` splits a file
+def split_model(data, delimiter)->list:
+    if not data:
+        return []
+    records = data.split(delimiter)
+    #A delimiter ending the file doesn't start another record
+    if len(records) > 1 and not records[-1]:
+        records.pop()
+    return records
+
+@pytest.mark.parametrize("delimiter", [b"\n", b"\r\n", b"||", b"ab"])
+@pytest.mark.parametrize("chunksize", [1, 2, 3, 5, 1 << 24])
+def test_ingest_matches_splitting_the_file(delimiter, chunksize, tmp_path):
+    path = tmp_path / "records"
+    for seed in range(40):
+        rng = random.Random(seed)
+        data = bytes(rng.choices(b"ab|\r\n", k=rng.randint(0, 25)))
+        #End with a delimiter half of the time
+        if seed % 2:
+            data += delimiter
+        path.write_bytes(data)
+        records = split_model(data, delimiter)
+        trie = Trie(alphabet="bytes")
+        assert trie.ingest(path, delimiter, chunksize=chunksize) == len(
+            records
+        )
+        assert trie.decompress() == records
+        #Decoded records of the same file
+        text = Trie.from_file(path, delimiter, chunksize=chunksize)
+        assert text.decompress() == [
+            record.decode() for record in records
+        ]
+
+@pytest.mark.parametrize("chunksize", [1, 4, 1 << 24])
+def test_ingest_decodes_records_split_across_chunks(chunksize, tmp_path):
+    path = tmp_path / "records"
+    words = ["héllo", "", "wörld", "日本語", "héllo"]
+    path.write_bytes("→".join(words).encode() + "→".encode())
+    reports = []
+    trie = Trie()
+    assert trie.ingest(
+        path, "→".encode(), progress=reports.append, chunksize=chunksize
+    ) == len(words)
+    assert trie.decompress() == words
+    assert reports[-1]["bytes"] == reports[-1]["size"]
+    assert reports[-1]["words"] == len(words)
+
+def test_ingest_an_empty_file(tmp_path):
+    path = tmp_path / "records"
+    path.write_bytes(b"")
+    trie = Trie(["a"])
+    assert trie.ingest(path) == 0
+    assert trie.decompress() == ["a"]
+    path.write_bytes(b"\n")
+    assert trie.ingest(path) == 1
+    assert trie.decompress() == ["a", ""]
+    with pytest.raises(ValueError):
+        trie.ingest(path, b"")
+
+#Cached queries after every kind of change give the same results
+# as a Trie without a cache that went through the same changes
+@pytest.mark.parametrize("cache_size", [3, 1000])
+@pytest.mark.parametrize("radix", [False, True])
+@pytest.mark.parametrize("seed", range(5))
+def test_cached_results_are_never_stale(cache_size, radix, seed, tmp_path):
+    rng = random.Random(seed)
+    words = random_words(rng, 40)
+    cached = Trie(words, radix=radix, cache_size=cache_size)
+    plain = Trie(words, radix=radix)
+    path = tmp_path / "records"
+    queries = random_words(rng, 8)
+    #Each query runs twice so the second can come from the cache
+    def check():
+        for word in queries:
+            assert (word in cached) == (word in cached) == (word in plain)
+            assert cached.__contains__(word, 2) == cached.__contains__(
+                word, 2
+            ) == plain.__contains__(word, 2)
+            for min_matches in (0, 1):
+                assert cached.nearest(word, min_matches) == cached.nearest(
+                    word, min_matches
+                ) == plain.nearest(word, min_matches)
+            assert cached.popular() == cached.popular() == plain.popular()
+    changes = [
+        lambda trie, word: trie.append(word),
+        lambda trie, word: trie.extend([word, word[::-1]]),
+        lambda trie, word: trie.delete(word),
+        lambda trie, word: trie.delete(word[:1], instance=2),
+        lambda trie, word: trie.merge(Trie([word, word + "a"], radix=radix)),
+        lambda trie, word: trie.ingest(path),
+        lambda trie, word: trie.rebuild_index(),
+        lambda trie, word: trie.prune(0.2, 0.05),
+    ]
+    check()
+    for _ in range(40):
+        change = rng.choice(changes)
+        word = rng.choice(queries)
+        path.write_text(word + "\n" + word[::-1])
+        change(cached, word)
+        change(plain, word)
+        check()
+    assert cached.cache.stats()["hits"]
+    assert cached.cache.stats()["invalidations"]
+
+@pytest.mark.parametrize("mmap", [True, False])
+@pytest.mark.parametrize("radix", [False, True])
+@pytest.mark.parametrize("track_order", [True, False])
+@pytest.mark.parametrize("seed", range(3))
+def test_save_and_load(mmap, radix, track_order, seed, tmp_path):
+    rng = random.Random(seed)
+    words = random_words(rng, rng.choice([0, 1, 100]))
+    trie = Trie(words, radix=radix, track_order=track_order)
+    path = tmp_path / "trie"
+    trie.save(path)
+    loaded = Trie.load(path, mmap)
+    assert isinstance(loaded.counts, np.memmap) == mmap
+    assert len(loaded) == len(trie)
+    assert list(loaded.frequencies()) == list(trie.frequencies())
+    assert loaded.depth_counts() == trie.depth_counts()
+    assert loaded.popular() == trie.popular()
+    for word in random_words(rng, 30):
+        assert (word in loaded) == (word in trie)
+        assert loaded.nearest(word, 0) == trie.nearest(word, 0)
+    if track_order:
+        assert loaded.decompress() == words
+        assert list(loaded.items()) == list(trie.items())
+        assert list(loaded.iter_decompress(3, 9)) == words[3:9]
+    else:
+        with pytest.raises(ValueError):
+            loaded.decompress()
+    #Saving what was loaded gives the same file
+    again = tmp_path / "again"
+    loaded.save(again)
+    assert again.read_bytes() == path.read_bytes()
+
+def test_load_rejects_other_files(tmp_path):
+    path = tmp_path / "trie"
+    path.write_bytes(b"not a trie at all")
+    with pytest.raises(ValueError):
+        Trie.load(path)
+    #Letters that don't fit in a fixed size can't be stored raw
+    with pytest.raises(TypeError):
+        Trie([(2**70, 1)], alphabet="tokens").save(path)
+
+def levenshtein(word, other)->int:
+    row = list(range(len(other) + 1))
+    for i, letter in enumerate(word, 1):
+        previous, row = row, [i]
+        for j, other_letter in enumerate(other, 1):
+            row.append(min(
+                row[j - 1] + 1, previous[j] + 1,
+                previous[j - 1] + (letter != other_letter)
+            ))
+    return row[-1]
+
+@pytest.mark.parametrize("radix", [False, True])
+@pytest.mark.parametrize("alphabet", [None, "tokens"])
+@pytest.mark.parametrize("seed", range(10))
+def test_fuzzy_matches_brute_force(radix, alphabet, seed):
+    rng = random.Random(seed)
+    #Tokens are the code points of the letters
+    make = (lambda word: tuple(map(ord, word))) if alphabet else str
+    words = [make(word) for word in random_words(rng, 60, "abcd")]
+    trie = Trie(words, radix=radix, alphabet=alphabet)
+    frozen = trie.freeze()
+    for query in random_words(rng, 15, "abcde"):
+        query = make(query)
+        max_distance = rng.randint(0, 3)
+        expected = sorted(
+            ((word, levenshtein(query, word), words.count(word)) 
+             for word in set(words)
+             if levenshtein(query, word) <= max_distance),
+            key=lambda match: (match[1], -match[2], match[0])
+        )
+        assert trie.fuzzy(query, max_distance) == expected
+        assert frozen.fuzzy(query, max_distance) == expected
+        assert trie.fuzzy(query, max_distance, 2) == expected[:2]